@@ -0,0 +1,269 @@
+# admission.py
+"""
+Admission control in front of the recognizer.
+
+Every recognizer call (cache misses only) takes a token from a TokenBucket
+refilled at `rate` calls per second. With a db_path the bucket lives in a
+SQLite file, so all gunicorn workers and job workers on the host share one
+budget. A call that finds the bucket empty reserves the next free token and
+sleeps until it is due.
+
+Requests are admitted (admit) only while a token taken now would be due
+within max_wait seconds, so an overloaded server answers 429 with
+Retry-After before any work is done. Once admitted, a request's calls wait
+for their tokens for as long as its deadline allows: its later chunks are
+not turned away after the earlier ones were paid for.
+
+Failed calls (sr.RequestError) are retried with full-jitter exponential
+backoff. A CircuitBreaker counts consecutive failures: once it opens, calls
+fail fast with CircuitOpen (503) until reset_timeout has passed, then one
+trial call is let through while the others wait; its outcome closes or
+re-opens the circuit.
+"""
+import contextlib
+import math
+import random
+import sqlite3
+import threading
+import time
+
+import speech_recognition as sr
+
+from shared_db import SharedDB
+
+
+class Overloaded(sr.RequestError):
+    """The recognizer was not called; retry_after says when to try again."""
+
+    status = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def retry_after_seconds(self):
+        """Whole seconds for a Retry-After header (at least 1)."""
+        return max(1, math.ceil(self.retry_after))
+
+
+class RateLimited(Overloaded):
+    """No recognizer token is free within the allowed wait."""
+
+    status = 429
+
+
+class CircuitOpen(Overloaded):
+    """The recognizer has been failing; calls are refused until the circuit resets."""
+
+    status = 503
+
+
+class TokenBucket:
+    """
+    Token bucket of `burst` tokens refilled at `rate` per second, shared
+    through a SQLite file (shared_db) when db_path is set. The token count
+    goes negative while calls are queued for future tokens, so waiting
+    callers are served in order.
+    """
+
+    def __init__(self, rate, burst=None, db_path=None, name="recognizer"):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.path = db_path
+        self.name = name
+        self._memory = {"tokens": self.burst, "updated": time.time()}
+        self._lock = threading.Lock()
+        self.db = None
+        if db_path:
+            self.db = SharedDB(
+                db_path,
+                "CREATE TABLE IF NOT EXISTS token_buckets ("
+                " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+            )
+
+    @contextlib.contextmanager
+    def _state(self):
+        """The refilled bucket state, locked across processes; changes are saved on exit."""
+        if self.db is None:
+            with self._lock:
+                yield self._refill(self._memory)
+            return
+
+        with self.db.connect() as conn:
+            # take the write lock before reading so two workers can't spend the same token
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            state = {"tokens": self.burst, "updated": time.time()} if row is None else \
+                {"tokens": row[0], "updated": row[1]}
+            yield self._refill(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, state["tokens"], state["updated"]),
+            )
+
+    def _refill(self, state):
+        now = time.time()
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.burst, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+        return state
+
+    def delay(self):
+        """Seconds until a token taken now would be due (0 when one is free)."""
+        with self._state() as state:
+            return max(0.0, (1 - state["tokens"]) / self.rate)
+
+    def reserve(self, max_wait=0.0):
+        """
+        Take a token. Returns the seconds to wait before using it (0 when one
+        is free); raises RateLimited, without taking it, when that would be
+        longer than max_wait.
+        """
+        with self._state() as state:
+            wait = max(0.0, (1 - state["tokens"]) / self.rate)
+            if wait > max_wait:
+                raise RateLimited(f"recognizer rate limit reached ({self.rate:g}/s)", wait - max_wait)
+            state["tokens"] -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """Per-process breaker over consecutive recognizer failures; thread-safe."""
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial = None  # start of the trial call while half-open
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        """Seconds until calls (or a trial call) are allowed again; 0 when closed."""
+        with self._cond:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def check(self):
+        """Raise CircuitOpen while the circuit is open, without changing it."""
+        retry_after = self.retry_after()
+        if retry_after > 0:
+            raise CircuitOpen(f"recognizer unavailable: {self.last_error}", retry_after)
+
+    def before_call(self):
+        """
+        Raise CircuitOpen while the circuit is open. Once reset_timeout has
+        passed, the first call goes through as the trial and calls arriving
+        meanwhile wait for its outcome (or take over if it never reports).
+        """
+        with self._cond:
+            while self.opened_at is not None:
+                now = time.monotonic()
+                if now < self.opened_at + self.reset_timeout:
+                    raise CircuitOpen(f"recognizer unavailable: {self.last_error}",
+                                      self.opened_at + self.reset_timeout - now)
+                if self._trial is None or now >= self._trial + self.reset_timeout:
+                    self._trial = now
+                    return
+                self._cond.wait(self._trial + self.reset_timeout - now)
+
+    def success(self):
+        with self._cond:
+            if self.opened_at is not None:
+                print("[INFO] Recognizer circuit closed.")
+            self.failures = 0
+            self.opened_at = self._trial = None
+            self._cond.notify_all()
+
+    def failure(self, error):
+        with self._cond:
+            self.failures += 1
+            self.last_error = error
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"[⚠️ Recognizer circuit open for {self.reset_timeout:g}s "
+                          f"after {self.failures} failures]: {error}")
+                self.opened_at = time.monotonic()
+                self._trial = None
+                self._cond.notify_all()
+
+
+def admit(bucket, breaker, max_wait):
+    """Raise Overloaded if a request starting now could not get a recognizer call in time."""
+    if breaker is not None:
+        breaker.check()
+    if bucket is not None:
+        try:
+            wait = bucket.delay()
+        except sqlite3.Error as e:
+            print(f"[⚠️ Rate limiter error]: {e}")
+            return
+        if wait > max_wait:
+            raise RateLimited(f"recognizer rate limit reached ({bucket.rate:g}/s)", wait - max_wait)
+
+
+class GuardedRecognizer:
+    """
+    Recognizer callable behind the breaker and the bucket, retrying failed
+    calls with jittered backoff until retries or the deadline run out. The
+    deadline is `deadline` (a time.monotonic() value, shared by all calls),
+    call_timeout seconds from the start of each call, or the earlier of the
+    two; a call waits for its token until then and raises RateLimited if it
+    would be due later.
+    """
+
+    def __init__(self, recognize, bucket=None, breaker=None, retries=2, backoff=0.5,
+                 deadline=None, call_timeout=None, metrics=None):
+        self.recognize = recognize
+        self.bucket = bucket
+        self.breaker = breaker
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.call_timeout = call_timeout
+        self.metrics = metrics
+
+    def _call_deadline(self):
+        deadline = math.inf if self.deadline is None else self.deadline
+        if self.call_timeout is not None:
+            deadline = min(deadline, time.monotonic() + self.call_timeout)
+        return deadline
+
+    def _acquire(self, deadline):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if self.bucket is None:
+            return
+        try:
+            wait = self.bucket.reserve(max(0.0, deadline - time.monotonic()))
+        except sqlite3.Error as e:
+            print(f"[⚠️ Rate limiter error]: {e}")
+            return
+        time.sleep(wait)
+
+    def __call__(self, audio_data, language="en-US"):
+        deadline = self._call_deadline()
+        for attempt in range(self.retries + 1):
+            self._acquire(deadline)
+            try:
+                text = self.recognize(audio_data, language=language)
+            except sr.UnknownValueError:
+                # the recognizer answered; the audio was just unintelligible
+                if self.breaker is not None:
+                    self.breaker.success()
+                raise
+            except sr.RequestError as e:
+                if self.breaker is not None:
+                    self.breaker.failure(e)
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if attempt == self.retries or delay >= deadline - time.monotonic():
+                    raise
+                if self.metrics is not None:
+                    self.metrics.registry.inc("stt_recognizer_retries_total")
+                time.sleep(delay)
+            else:
+                if self.breaker is not None:
+                    self.breaker.success()
+                return text
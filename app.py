@@ -1,57 +1,296 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import speech_recognition as sr
-import tempfile
-from pydub import AudioSegment, silence
+import numpy as np
+import json
 import os
-import re
+import time
+
+import admission
+import audio_io
+import ingest
+import punctuation
+from cache import RecognitionCache
+from ingest import AudioTooLong, ChunkStream, InvalidUpload, MultipartFile
+from jobs import JobStore
+from metrics import Metrics, Trace, profiled
+from recognition import LiveRecognition, RecognitionTimeout, iter_recognize_chunks, recognize_chunks
+from transcript import merge_segments, normalize_whitespace
+from vad import LiveSegmenter
 
-# Optional punctuation model (English only)
-try:
-    from deepsegment import DeepSegment
-    segmenter = DeepSegment("en")
-    print("[INFO] DeepSegment loaded for English punctuation.")
-except Exception:
-    segmenter = None
-    print("[INFO] DeepSegment NOT available — punctuation disabled for English.")
 
 app = Flask(__name__)
 
+# Recognition settings (overridable per deployment via env vars)
+app.config["STT_MAX_CONCURRENCY"] = int(os.environ.get("STT_MAX_CONCURRENCY", "4"))
+# gthread workers aren't killed by a slow request, but each one holds one of
+# the worker's 8 threads; 25s answers within the usual 30s proxy timeouts and
+# frees the thread, and longer recordings belong on POST /jobs
+app.config["STT_REQUEST_DEADLINE"] = float(os.environ.get("STT_REQUEST_DEADLINE", "25"))
+# callable(audio_data, language=...) -> str; None means Recognizer.recognize_google
+app.config["STT_RECOGNIZER"] = None
+# results keyed on chunk PCM + language; STT_CACHE_DB adds a tier shared by all workers
+app.config["STT_CACHE"] = RecognitionCache(
+    max_entries=int(os.environ.get("STT_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("STT_CACHE_TTL", str(24 * 3600))),
+    db_path=os.environ.get("STT_CACHE_DB") or None,
+)
+# upload decoding: analysis window and longest accepted recording (seconds)
+app.config["STT_INGEST_WINDOW"] = ingest.WINDOW_SECONDS
+# /transcribe/stream starts with a window this short so its first chunk event
+# doesn't wait for a whole window of upload (see ingest.ChunkStream)
+app.config["STT_STREAM_FIRST_WINDOW"] = ingest.FIRST_WINDOW_SECONDS
+app.config["STT_MAX_AUDIO_SECONDS"] = ingest.MAX_AUDIO_SECONDS
+# queue for POST /jobs, created on first use (see jobs.py for the workers)
+app.config["STT_JOB_STORE"] = None
+# per-stage timings and counters for GET /metrics; STT_METRICS_DB sums them over all workers
+app.config["STT_METRICS"] = Metrics(os.environ.get("STT_METRICS_DB") or None)
+# ?profile=1 attaches a cProfile summary to the response; off unless STT_ALLOW_PROFILE=1,
+# since profiling slows the request down and exposes code paths
+app.config["STT_ALLOW_PROFILE"] = os.environ.get("STT_ALLOW_PROFILE", "0") != "0"
+# recognizer calls per second (0 = unlimited); STT_RATE_LIMIT_DB shares the budget with all workers
+_rate_limit = float(os.environ.get("STT_RATE_LIMIT", "0"))
+app.config["STT_RATE_LIMITER"] = admission.TokenBucket(
+    _rate_limit,
+    burst=float(os.environ.get("STT_RATE_BURST", "0")) or None,
+    db_path=os.environ.get("STT_RATE_LIMIT_DB") or None,
+) if _rate_limit > 0 else None
+# requests that would wait longer than this for their first token get 429 up front;
+# admitted ones queue for tokens until their deadline
+app.config["STT_RATE_MAX_WAIT"] = float(os.environ.get("STT_RATE_MAX_WAIT", "10"))
+# failed recognizer calls are retried with jittered exponential backoff
+app.config["STT_RETRIES"] = int(os.environ.get("STT_RETRIES", "2"))
+app.config["STT_RETRY_BACKOFF"] = float(os.environ.get("STT_RETRY_BACKOFF", "0.5"))
+# after this many consecutive failed calls, fail fast with 503 for STT_BREAKER_RESET seconds
+app.config["STT_CIRCUIT_BREAKER"] = admission.CircuitBreaker(
+    threshold=int(os.environ.get("STT_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.environ.get("STT_BREAKER_RESET", "30")),
+)
+
+
+def transcribe_options():
+    """Language and punctuation settings from the query string."""
+    # Language parameter (default to Kannada)
+    lang_code = request.args.get("lang", "kn-IN").strip() or "kn-IN"
 
-def normalize_whitespace(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    # Whether to try punctuation (also auto-enabled for English if DeepSegment is installed)
+    punctuate_flag = request.args.get("punctuate", "").strip()
+    punctuate = bool(punctuate_flag) or (lang_code.startswith("en") and punctuation.available())
+    return lang_code, punctuate
 
 
-def merge_transcripts_with_dedup(transcripts, max_overlap_words=3):
+def upload_stream():
+    """
+    The uploaded audio as a readable stream, or None: either the "audio"
+    form-data file, or the raw request body when it is sent as audio/* or
+    application/octet-stream. Both are read straight off the connection, so
+    memory does not grow with the size of the upload.
+    """
+    if request.mimetype == "multipart/form-data" and request.mimetype_params.get("boundary"):
+        upload = MultipartFile(request.stream, request.mimetype_params["boundary"], "audio")
+        try:
+            return upload if upload.open() else None
+        except ValueError:
+            return None  # malformed form data
+    if request.mimetype.startswith("audio/") or request.mimetype == "application/octet-stream":
+        return request.stream
+    return None
+
+
+def load_chunks(stream, first_window=None):
+    """
+    Steps 1-4: decode the upload, split it on silence and plan the chunks.
+
+    Returns an ingest.ChunkStream: iterating it decodes the upload block by
+    block (WAV directly, other formats through ffmpeg) into 16 kHz mono int16
+    and yields each planned chunk as sr.AudioData; its spans list holds the
+    chunks' (start_ms, end_ms) offsets. The silence split is the vectorized
+    equivalent of pydub's split_on_silence and also yields the recording's
+    noise floor, so chunks don't need their own calibration. first_window
+    (seconds) shortens the first analysis window to get chunks out sooner.
+    """
+    return ChunkStream(
+        stream,
+        window_seconds=app.config["STT_INGEST_WINDOW"],
+        max_seconds=app.config["STT_MAX_AUDIO_SECONDS"],
+        min_silence_len=800,  # 0.8s silence threshold
+        silence_offset_db=14,  # threshold = audio.dBFS - 14
+        keep_silence=400,  # small padding to keep context
+        max_chunk_ms=30000,  # chunks target ~20-30s ...
+        overlap_ms=500,  # ... with small overlap to avoid truncation
+        first_window_seconds=first_window,
+    )
+
+
+def make_recognizer(noise_floor, deadline, trace=None, call_timeout=None):
     """
-    Join chunk transcripts with a simple overlap-deduplication heuristic.
-    Looks for an overlap of up to max_overlap_words between the end of the previous
-    transcript and the start of the next transcript and removes duplicates.
-    Returns a single merged string.
+    Recognizer callable for one request (Google STT unless STT_RECOGNIZER is
+    set), behind the recognition cache; its stats() are the request's hits/misses.
+    Cache misses go through admission control (rate limit, retries, circuit
+    breaker). deadline (time.monotonic()) bounds all calls together,
+    including their wait for a rate limit token; sessions without one give
+    each call call_timeout seconds instead.
+    With a trace, the time of every call that misses the cache is added to
+    its "recognizer_calls" stage.
     """
-    if not transcripts:
-        return ""
+    recognizer = sr.Recognizer()
+    if noise_floor > 0:
+        # same target adjust_for_ambient_noise converges to, computed once
+        recognizer.energy_threshold = noise_floor * recognizer.dynamic_energy_ratio
+    # a single slow round trip must not outlive the request either
+    recognizer.operation_timeout = call_timeout if deadline is None else max(0.0, deadline - time.monotonic())
+    recognize = app.config["STT_RECOGNIZER"] or recognizer.recognize_google
+    if trace is not None:
+        recognize = trace.timed("recognizer_calls", recognize, app.config["STT_METRICS"])
+    recognize = admission.GuardedRecognizer(
+        recognize,
+        bucket=app.config["STT_RATE_LIMITER"],
+        breaker=app.config["STT_CIRCUIT_BREAKER"],
+        retries=app.config["STT_RETRIES"],
+        backoff=app.config["STT_RETRY_BACKOFF"],
+        deadline=deadline,
+        call_timeout=call_timeout,
+        metrics=app.config["STT_METRICS"],
+    )
+    return app.config["STT_CACHE"].wrap(recognize)
+
+
+def admit():
+    """Raise admission.Overloaded (429/503) when a new request would be rate limited or the recognizer is down."""
+    admission.admit(app.config["STT_RATE_LIMITER"], app.config["STT_CIRCUIT_BREAKER"],
+                    app.config["STT_RATE_MAX_WAIT"])
+
+
+def overloaded_payload(e):
+    return {"error": f"Service overloaded: {str(e)}", "retry_after": e.retry_after_seconds()}
+
+
+def error_payload(e):
+    """(payload, status code) for an exception that ended a transcription."""
+    if isinstance(e, admission.Overloaded):
+        return overloaded_payload(e), e.status
+    if isinstance(e, sr.RequestError):
+        # Google API/network issue
+        return {"error": f"Google API error: {str(e)}"}, 500
+    if isinstance(e, RecognitionTimeout):
+        return {"error": f"Transcription timed out: {str(e)}"}, 504
+    if isinstance(e, AudioTooLong):
+        return {"error": str(e)}, 413
+    if isinstance(e, InvalidUpload):
+        return {"error": f"Invalid upload: {str(e)}"}, 400
+    # broad fallback
+    return {"error": f"Internal server error: {str(e)}"}, 500
+
+
+def record_chunks(trace, chunks):
+    """Copy the ingest stage timings, audio length and chunk count into the trace."""
+    for stage, seconds in chunks.timings.items():
+        trace.add(stage, seconds)
+    trace.audio_seconds = chunks.decoded_ms / 1000
+    trace.chunks = len(chunks.spans)
+
+
+def build_payload(chunk_spans, raw_transcripts, lang_code, punctuate, trace=None):
+    """Steps 6-7: merge chunk texts and optionally punctuate them."""
+    trace = trace or Trace("payload")
+
+    # 6) Merge transcripts with dedup heuristic (empty segments are dropped)
+    with trace.span("merge"):
+        merged, segments = merge_segments(
+            ((start, end, text) for (start, end), text in zip(chunk_spans, raw_transcripts)),
+            max_overlap_words=3,
+        )
 
-    merged = transcripts[0].strip()
-    for nxt in transcripts[1:]:
-        prev_words = merged.split()
-        next_words = nxt.strip().split()
-        overlap_found = 0
+    response_payload = {"transcript": merged, "segments": segments}
+
+    # 7) Optional punctuation for English using DeepSegment (or if user asked)
+    if punctuate and lang_code.startswith("en") and punctuation.available():
+        try:
+            # DeepSegment expects raw text -> returns list of sentences;
+            # loaded on first use and batched with concurrent requests
+            with trace.span("punctuate"):
+                segmented = punctuation.segment_long(merged)
+            # join sentences with space — segmented items should include punctuation
+            punctuated = " ".join([s.strip() for s in segmented if s and s.strip()])
+            punctuated = normalize_whitespace(punctuated)
+            # If DeepSegment produced no punctuation (same as input), still return it as 'punctuated'
+            response_payload["punctuated"] = punctuated
+        except Exception as e:
+            # fail gracefully, include debug note
+            print(f"[⚠️ DeepSegment error]: {e}")
+            response_payload["punctuation_error"] = str(e)
+
+    return response_payload
+
+
+def job_store():
+    if app.config["STT_JOB_STORE"] is None:
+        app.config["STT_JOB_STORE"] = JobStore()
+    return app.config["STT_JOB_STORE"]
+
+
+def wants_profile():
+    return app.config["STT_ALLOW_PROFILE"] and request.args.get("profile", "").strip() not in ("", "0")
 
-        # test overlaps length from max_overlap_words down to 1
-        for k in range(max_overlap_words, 0, -1):
-            if len(prev_words) >= k and len(next_words) >= k:
-                if prev_words[-k:] == next_words[:k]:
-                    overlap_found = k
-                    break
 
-        if overlap_found:
-            # drop the overlapping prefix from next_words
-            merged += " " + " ".join(next_words[overlap_found:])
-        else:
-            merged += " " + " ".join(next_words)
+def traced_response(payload, status, trace):
+    """JSON response carrying the trace: "timing" in the body, X-Request-Id and Server-Timing headers."""
+    payload["timing"] = trace.finish(app.config["STT_METRICS"], status)
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers["X-Request-Id"] = trace.request_id
+    response.headers["Server-Timing"] = trace.server_timing()
+    if "retry_after" in payload:
+        response.headers["Retry-After"] = str(payload["retry_after"])
+    return response
 
-    return normalize_whitespace(merged)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events, trace):
+    """Stream the sse_event strings from the events generator as text/event-stream."""
+    return Response(
+        # the upload may still be read while the response streams
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-Id": trace.request_id},
+    )
+
+
+def transcribe_upload(stream, lang_code, punctuate, trace):
+    """Steps 1-7 for one upload; returns (payload, status code)."""
+    deadline = time.monotonic() + app.config["STT_REQUEST_DEADLINE"]
+    chunks = recognize = None
+
+    try:
+        chunks = load_chunks(stream)
+
+        # 5) Transcribe chunks with Google STT, several at a time, while the
+        # rest of the upload is still being decoded
+        recognize = make_recognizer(chunks.noise_floor, deadline, trace)
+        with trace.span("recognize"):
+            texts = recognize_chunks(
+                chunks,
+                recognize,
+                lang_code,
+                max_workers=app.config["STT_MAX_CONCURRENCY"],
+                timeout=max(0.0, deadline - time.monotonic()),
+            )
+
+        raw_transcripts = [normalize_whitespace(t) for t in texts]
+        response_payload = build_payload(chunks.spans, raw_transcripts, lang_code, punctuate, trace)
+        response_payload["cache"] = recognize.stats()
+        return response_payload, 200
+    except Exception as e:
+        return error_payload(e)
+    finally:
+        if chunks is not None:
+            record_chunks(trace, chunks)
+        if recognize is not None:
+            trace.cache = recognize.stats()
 
 
 @app.route("/")
@@ -63,148 +302,266 @@ def index():
 def transcribe_audio():
     """
     POST /transcribe?lang=kn-IN&punctuate=1
-    body: form-data audio: <wav file>
+    body: form-data audio: <wav/flac/ogg/mp3 file>, or the raw file as an audio/* body
 
     Returns JSON:
       {
         "transcript": "raw merged transcript",
-        "punctuated": "optional punctuated transcript"  # only if punctuation applied
+        "segments": [{"start_ms": 0, "end_ms": 12400, "text": "..."}, ...],
+        "punctuated": "optional punctuated transcript",  # only if punctuation applied
+        "cache": {"hits": 0, "misses": 3},  # recognition cache use for this request
+        "timing": {"request_id": "...", "total_s": 4.2, "audio_s": 95.0, "chunks": 3, "rtf": 0.044,
+                   "stages": {"decode": 0.05, "segment": 0.01, "plan": 0.0, "slice": 0.0,
+                              "recognize": 4.1, "recognizer_calls": 11.8, "merge": 0.0}},
+        "profile": "cProfile summary"  # only with ?profile=1
       }
+
+    Stage times overlap: chunks are decoded while earlier ones are being
+    recognized, and recognizer_calls adds up calls running in parallel.
+
+    When the recognizer rate limit (STT_RATE_LIMIT) would hold the request
+    back longer than STT_RATE_MAX_WAIT, it is answered 429 before the upload
+    is read; while the recognizer keeps failing (circuit open) the answer is
+    503. Both come with a Retry-After header and {"error", "retry_after"}.
+    Admitted requests wait for later recognizer calls until their deadline.
     """
-    if "audio" not in request.files:
+    trace = Trace("transcribe")
+    try:
+        # reject before reading the upload if the recognizer can't take it
+        admit()
+    except admission.Overloaded as e:
+        return traced_response(overloaded_payload(e), e.status, trace)
+
+    stream = upload_stream()
+    if stream is None:
         return jsonify({"error": "No audio file provided"}), 400
 
-    # Language parameter (default to Kannada)
-    lang_code = request.args.get("lang", "kn-IN").strip() or "kn-IN"
+    lang_code, punctuate = transcribe_options()
+    with profiled(wants_profile()) as profile:
+        payload, status = transcribe_upload(stream, lang_code, punctuate, trace)
+    payload.update(profile)
+    return traced_response(payload, status, trace)
 
-    # Whether to try punctuation (also auto-enabled for English if segmenter present)
-    punctuate_flag = request.args.get("punctuate", "").strip()
-    punctuate = bool(punctuate_flag) or (lang_code.startswith("en") and segmenter is not None)
 
-    audio_file = request.files["audio"]
-    wav_path = None
-    processed_chunks = []
+@app.route("/transcribe/stream", methods=["POST"])
+def transcribe_stream():
+    """
+    POST /transcribe/stream?lang=kn-IN&punctuate=1
+    body: same as /transcribe
+
+    Same chunking and parameters as /transcribe, returned as Server-Sent Events
+    while the chunks are recognized:
+      event: chunk  data: {"index": 0, "start_ms": 0, "end_ms": 12400, "text": "..."}
+                    (one per chunk, in completion order)
+      event: done   data: <the /transcribe JSON payload>
+      event: error  data: {"error": "..."}  (ends the stream)
+
+    Chunking starts with a STT_STREAM_FIRST_WINDOW (60 s) analysis window
+    instead of a full one, so the first chunk is recognized once that much
+    audio has arrived; for longer recordings its chunk edges (and so the
+    payload) can differ slightly from /transcribe's.
+    """
+    trace = Trace("transcribe_stream")
+    try:
+        admit()
+    except admission.Overloaded as e:
+        return traced_response(overloaded_payload(e), e.status, trace)
+
+    stream = upload_stream()
+    if stream is None:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    lang_code, punctuate = transcribe_options()
+    deadline = time.monotonic() + app.config["STT_REQUEST_DEADLINE"]
 
     try:
-        # 1) Save uploaded audio temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            audio_file.save(tmp.name)
-            wav_path = tmp.name
-
-        # 2) Load and normalize audio
-        audio = AudioSegment.from_wav(wav_path).set_channels(1).set_frame_rate(16000)
-
-        # 3) Silence-based chunking (short pauses ~ natural speech)
-        primary_chunks = silence.split_on_silence(
-            audio,
-            min_silence_len=800,  # 0.8s silence threshold
-            silence_thresh=audio.dBFS - 14,
-            keep_silence=400,  # small padding to keep context
-        )
+        chunks = load_chunks(stream, first_window=app.config["STT_STREAM_FIRST_WINDOW"])
+        recognize = make_recognizer(chunks.noise_floor, deadline, trace)
+    except Exception as e:
+        return traced_response(*error_payload(e), trace)
+
+    def events():
+        raw_transcripts = {}
+        status = 200
+        try:
+            # chunks are decoded as they are needed and dropped once recognized
+            with trace.span("recognize"):
+                for i, text in iter_recognize_chunks(
+                    chunks,
+                    recognize,
+                    lang_code,
+                    max_workers=app.config["STT_MAX_CONCURRENCY"],
+                    timeout=max(0.0, deadline - time.monotonic()),
+                ):
+                    raw_transcripts[i] = normalize_whitespace(text)
+                    start, end = chunks.spans[i]
+                    yield sse_event("chunk", {"index": i, "start_ms": start, "end_ms": end,
+                                              "text": raw_transcripts[i]})
+
+            ordered = [raw_transcripts[i] for i in range(len(chunks.spans))]
+            response_payload = build_payload(chunks.spans, ordered, lang_code, punctuate, trace)
+            response_payload["cache"] = recognize.stats()
+            yield sse_event("done", response_payload)
+        except Exception as e:
+            payload, status = error_payload(e)
+            yield sse_event("error", payload)
+        finally:
+            record_chunks(trace, chunks)
+            trace.cache = recognize.stats()
+            trace.finish(app.config["STT_METRICS"], status)
+
+    return sse_response(events(), trace)
+
+
+@app.route("/transcribe/live", methods=["POST"])
+def transcribe_live():
+    """
+    POST /transcribe/live?lang=kn-IN&punctuate=1
+    Content-Type: audio/L16; rate=16000   (raw 16 kHz mono int16 little-endian)
+    Transfer-Encoding: chunked            (sent while it is being captured)
+
+    Live mode: the audio is segmented as it arrives and each segment is
+    recognized as soon as 800 ms of silence close it, while the upload
+    continues. Results are Server-Sent Events on the same connection:
+      event: ready    data: {"sample_rate": 16000}  (as soon as the session starts)
+      event: segment  data: {"index": 0, "start_ms": 0, "end_ms": 4200, "text": "..."}
+                      (one per segment, in completion order)
+      event: done     data: <the /transcribe JSON payload>, once the upload ends
+      event: error    data: {"error": "..."}  (ends the stream)
+
+    Needs a threaded server (gunicorn --worker-class gthread) so a session
+    can outlive the worker timeout.
+    """
+    try:
+        rate = int(request.mimetype_params.get("rate", audio_io.SAMPLE_RATE))
+    except ValueError:
+        rate = None
+    if request.mimetype not in ("audio/l16", "application/octet-stream") or rate != audio_io.SAMPLE_RATE:
+        return jsonify({"error": "Send raw 16 kHz mono int16 PCM as audio/L16; rate=16000"}), 415
+
+    lang_code, punctuate = transcribe_options()
+    stream = request.stream
+    max_ms = app.config["STT_MAX_AUDIO_SECONDS"] * 1000
+    block_bytes = audio_io.SAMPLE_RATE // 10 * audio_io.SAMPLE_WIDTH  # read ~100 ms at a time
+
+    trace = Trace("transcribe_live")
+    try:
+        admit()
+    except admission.Overloaded as e:
+        return traced_response(overloaded_payload(e), e.status, trace)
+
+    def events():
+        segmenter = LiveSegmenter(audio_io.SAMPLE_RATE, min_silence_len=800, keep_silence=300)
+        # a session has no overall deadline; each segment gets the usual per-request budget
+        recognize = make_recognizer(0, None, trace, call_timeout=app.config["STT_REQUEST_DEADLINE"])
+        live = LiveRecognition(recognize, lang_code, max_workers=app.config["STT_MAX_CONCURRENCY"])
+        spans, raw_transcripts = [], {}
+        status = 200
+
+        def results(batch):
+            for i, text in batch:
+                raw_transcripts[i] = normalize_whitespace(text)
+                start, end = spans[i]
+                yield sse_event("segment", {"index": i, "start_ms": start, "end_ms": end,
+                                            "text": raw_transcripts[i]})
+
+        rest, received_ms = b"", 0
+        try:
+            yield sse_event("ready", {"sample_rate": audio_io.SAMPLE_RATE})
+            while True:
+                data = stream.read(block_bytes)
+                if data:
+                    data = rest + data
+                    cut = len(data) - len(data) % audio_io.SAMPLE_WIDTH
+                    data, rest = data[:cut], data[cut:]
+                    samples = np.frombuffer(data, dtype=np.int16)
+                    received_ms += len(samples) * 1000 // audio_io.SAMPLE_RATE
+                    if received_ms > max_ms:
+                        raise AudioTooLong(f"audio is longer than the {max_ms / 1000:.0f}s limit")
+                    with trace.span("segment"):
+                        closed = segmenter.feed(samples)
+                else:
+                    closed = [s for s in [segmenter.flush()] if s is not None]
+
+                for start, end, segment in closed:
+                    spans.append((start, end))
+                    live.submit(audio_io.to_audio_data(segment))
+                yield from results(live.finished())
+                if not data:
+                    break
+
+            yield from results(live.drain(timeout=app.config["STT_REQUEST_DEADLINE"]))
+            ordered = [raw_transcripts[i] for i in range(len(spans))]
+            response_payload = build_payload(spans, ordered, lang_code, punctuate, trace)
+            response_payload["cache"] = recognize.stats()
+            yield sse_event("done", response_payload)
+        except Exception as e:
+            payload, status = error_payload(e)
+            yield sse_event("error", payload)
+        finally:
+            live.close()
+            trace.audio_seconds = received_ms / 1000
+            trace.chunks = len(spans)
+            trace.cache = recognize.stats()
+            trace.finish(app.config["STT_METRICS"], status)
+
+    return sse_response(events(), trace)
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    POST /jobs?lang=kn-IN&punctuate=1
+    body: same as /transcribe
 
-        # 4) Merge into chunks targeting ~20-30s with small overlap to avoid truncation
-        max_chunk_ms = 30000  # 30 seconds
-        overlap_ms = 500      # 0.5s overlap
-        current = AudioSegment.silent(duration=0)
-
-        for idx, chunk in enumerate(primary_chunks):
-            if len(chunk) < 800:  # skip extremely tiny noises
-                continue
-
-            if len(current) + len(chunk) <= max_chunk_ms:
-                current += chunk
-            else:
-                if len(current) > 800:
-                    processed_chunks.append(current)
-                current = chunk
-
-            # add overlap padding between pieces to reduce word-cut risk
-            if idx < len(primary_chunks) - 1:
-                current += AudioSegment.silent(duration=overlap_ms)
-
-        if len(current) > 800:
-            processed_chunks.append(current)
-
-        # If no chunks detected, fallback to treating entire audio as one chunk
-        if not processed_chunks:
-            processed_chunks = [audio]
-
-        # 5) Transcribe each chunk with Google STT
-        recognizer = sr.Recognizer()
-        raw_transcripts = []
-
-        for i, chunk in enumerate(processed_chunks, start=1):
-            # export chunk to temp file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as chunk_file:
-                chunk.export(chunk_file.name, format="wav")
-                chunk_path = chunk_file.name
-
-            try:
-                with sr.AudioFile(chunk_path) as source:
-                    # short ambient adjustment; keep small to avoid long processing time
-                    try:
-                        recognizer.adjust_for_ambient_noise(source, duration=0.2)
-                    except Exception:
-                        # If ambient adjustment fails for some reason, continue
-                        pass
-                    audio_data = recognizer.record(source)
-
-                # call Google STT
-                text = recognizer.recognize_google(audio_data, language=lang_code)
-                text = normalize_whitespace(text)
-                raw_transcripts.append(text)
-
-            except sr.UnknownValueError:
-                # record unknown as empty string (do not pollute punctuation)
-                raw_transcripts.append("")
-            except sr.RequestError as e:
-                # Google API/network issue -> abort with 500
-                return jsonify({"error": f"Google API error: {str(e)}"}), 500
-            finally:
-                # cleanup chunk file
-                try:
-                    os.remove(chunk_path)
-                except Exception:
-                    pass
-
-        # 6) Merge transcripts with dedup heuristic and clean placeholders
-        # remove empty segments and placeholders
-        cleaned = [t for t in raw_transcripts if t and t.strip()]
-        merged = merge_transcripts_with_dedup(cleaned, max_overlap_words=3)
-
-        # final cleanup (strip repeated whitespace)
-        merged = normalize_whitespace(merged)
-
-        response_payload = {"transcript": merged}
-
-        # 7) Optional punctuation for English using DeepSegment (or if user asked)
-        if punctuate and lang_code.startswith("en") and segmenter:
-            try:
-                # DeepSegment expects raw text -> returns list of sentences
-                segmented = segmenter.segment_long(merged)
-                # join sentences with space — segmented items should include punctuation
-                punctuated = " ".join([s.strip() for s in segmented if s and s.strip()])
-                punctuated = normalize_whitespace(punctuated)
-                # If DeepSegment produced no punctuation (same as input), still return it as 'punctuated'
-                response_payload["punctuated"] = punctuated
-            except Exception as e:
-                # fail gracefully, include debug note
-                print(f"[⚠️ DeepSegment error]: {e}")
-                response_payload["punctuation_error"] = str(e)
-
-        return jsonify(response_payload)
-
-    except Exception as ex:
-        # broad fallback
-        return jsonify({"error": f"Internal server error: {str(ex)}"}), 500
+    Queues the recording for the background workers and returns at once:
+      202 {"job_id": "...", "status": "queued", "status_url": "/jobs/<id>"}
+    """
+    stream = upload_stream()
+    if stream is None:
+        return jsonify({"error": "No audio file provided"}), 400
 
-    finally:
-        # always remove temp upload
-        if wav_path and os.path.exists(wav_path):
-            try:
-                os.remove(wav_path)
-            except Exception:
-                pass
+    lang_code, punctuate = transcribe_options()
+    try:
+        job_id = job_store().submit(stream, lang_code, punctuate)
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    GET /jobs/<id>
+
+    Returns JSON:
+      {
+        "job_id": "...",
+        "status": "queued" | "running" | "done" | "failed",
+        "progress": {"chunks_done": 3, "chunks_total": 40},  # total grows while decoding
+        "result": {...},  # the /transcribe payload, once done
+        "error": "..."    # once failed
+      }
+    """
+    job = job_store().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    GET /metrics
+
+    Prometheus text format: request counts and latency, per-stage time
+    histograms (stt_stage_seconds{stage=...}), recognizer call latency,
+    audio seconds, chunks, cache lookups and the real-time factor. Summed
+    over all workers when STT_METRICS_DB is set.
+    """
+    return Response(app.config["STT_METRICS"].render(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
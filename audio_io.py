@@ -0,0 +1,27 @@
+# audio_io.py
+"""
+In-memory audio helpers.
+
+Audio is kept as 16 kHz mono int16 NumPy arrays (see ingest.py); chunks are
+sliced out by millisecond offsets and handed to the recognizer as
+sr.AudioData over the array's memory, so nothing is written to disk or
+re-encoded before the recognizer encodes it.
+"""
+import speech_recognition as sr
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # bytes, int16
+
+
+def ms_to_frame(ms, sample_rate=SAMPLE_RATE):
+    return ms * sample_rate // 1000
+
+
+def slice_ms(samples, start_ms, end_ms, sample_rate=SAMPLE_RATE):
+    """Zero-copy view of samples between two millisecond offsets."""
+    return samples[ms_to_frame(start_ms, sample_rate):ms_to_frame(end_ms, sample_rate)]
+
+
+def to_audio_data(samples, sample_rate=SAMPLE_RATE):
+    """Wrap an int16 array (or view) as sr.AudioData without copying it."""
+    return sr.AudioData(memoryview(samples).cast("B"), sample_rate, SAMPLE_WIDTH)
@@ -0,0 +1,1723 @@
+# benchmark.py
+"""
+Offline checks and timings for the audio pipeline.
+
+    python benchmark.py vad [--seconds 120]
+    python benchmark.py recognize [--chunks 20] [--latency 0.2] [--workers 4]
+    python benchmark.py tempfiles [--seconds 60]
+    python benchmark.py merge [--segments 3000]
+    python benchmark.py plan [--pieces 5000]
+    python benchmark.py startup
+    python benchmark.py ingest [--minutes 120]
+    python benchmark.py client [--chunks 30] [--latency 0.2] [--in-flight 30]
+    python benchmark.py stream [--seconds 50] [--latency 0.3]
+    python benchmark.py live [--seconds 30] [--latency 0.3]
+    python benchmark.py metrics [--workers 3] [--requests 4]
+    python benchmark.py admission [--workers 3] [--requests 6] [--quota 6] [--latency 0.1]
+    python benchmark.py punctuation [--texts 200] [--window 10]
+    python benchmark.py cache [--seconds 120] [--ttl 2]
+    python benchmark.py jobs [--jobs 200] [--workers 4]
+    python benchmark.py suite [--seconds 10 60 600 7200] [--latency 0.05] [--error-rate 0.05]
+                              [--workers 4] [--gaps 0.1 2.0] [--merge-segments 3000]
+                              [--baseline benchmark_baseline.json] [--update-baseline]
+
+vad: compares vad.split_on_silence against pydub.silence.split_on_silence on
+synthetic speech-like audio (tone bursts separated by silences), asserts the
+chunk boundaries are identical and prints both timings.
+
+recognize: runs recognition.recognize_chunks against a fake recognizer with
+artificial latency, serially and concurrently, then checks that a RequestError
+and a missed deadline both stop the remaining chunks.
+
+tempfiles: posts a synthetic WAV to /transcribe through the Flask test client
+with the temp dir redirected to an empty directory, and checks that nothing
+is created there while the request runs.
+
+merge: merges a very long synthetic transcript (words from benchmark_transcript.txt
+split into many segments with overlapping boundaries) with the previous
+string-resplitting merger and with transcript.merge_segments, checks the text
+is identical and prints both timings.
+
+plan: packs many tiny silence-split pieces with the previous AudioSegment
+concatenation and with chunking.plan_chunks + one slice per chunk.
+
+startup: imports app in a fresh interpreter, as a gunicorn worker would, with
+the punctuation model lazy (default) and preloaded (STT_PRELOAD_PUNCTUATION=1)
+and reports import time and peak RSS for each.
+
+ingest: checks that streaming WAV decoding gives the same samples as pydub
+(stereo 44.1 kHz, 8-bit, 24-bit) and the same chunks as a whole-file pass
+(also across a pause longer than a chunk), then streams a long synthetic 44.1 kHz stereo WAV (generated on the fly)
+through ingest.ChunkStream and reports peak traced memory. Finally posts
+up to 20 minutes of it to /transcribe through the WSGI app, as a raw body
+and as multipart form data, and checks the multipart upload is not
+buffered either.
+
+client: serves app.py on a local port with a fake recognizer (latency varies
+per chunk) and uploads the same chunks one by one with bare requests.post as
+WAV, the way test_api.py used to, and with client.STTClient (pooled, FLAC,
+pipelined). Checks the texts come back in order, including when the server
+answers some uploads with 503, and prints wall times and upload sizes.
+
+stream: posts a synthetic recording to /transcribe/stream through the WSGI
+app with a fake recognizer recognizing one chunk at a time, and checks the
+first chunk event arrives after about one recognition, every event carries
+its index, offsets and text, and done equals the /transcribe payload. Then
+checks a RequestError ends the stream with an error event, and that a long
+upload arriving slowly gets its first text once the first analysis window
+is in, not the whole upload.
+
+live: serves app.py on a local port with a fake recognizer and replays
+synthetic speech in real time through client.STTClient.stream_live (a fake
+microphone). Checks every utterance's text arrives while the upload is still
+going, within one silence timeout plus one recognition of the end of the
+utterance, and compares the segments with a whole-file silence split. Then
+runs a session longer than STT_REQUEST_DEADLINE with a rate limit and a
+recognizer that fails each segment's first attempt, and checks every
+segment is still retried and recognized.
+
+metrics: runs several worker processes sharing one STT_METRICS_DB, each
+posting synthetic uploads to /transcribe through the Flask test client, then
+checks GET /metrics in a fresh process reports the sums over all of them and
+that ?profile=1 attaches a cProfile summary only when STT_ALLOW_PROFILE is on.
+
+admission: serves a stub recognizer endpoint that answers 429 above --quota
+calls per second, and floods it from several worker processes posting
+staggered uploads through the Flask test client: first without a rate
+limit, then with one TokenBucket shared through SQLite at 80% of the quota.
+With the limiter, checks the stub rejects nothing and every request is
+either transcribed or answered 429 with Retry-After, and counts how many of
+those were turned away before any recognition. Then takes the stub down to
+check the circuit breaker fails fast (503) and closes again, and that
+client.STTClient retries 429s after Retry-After until every chunk is done.
+
+punctuation: runs punctuation.segment_long_batch with a stub segmenter
+(sentence ends depend on where each window starts) over many texts,
+including carried prefixes of a whole window and more, and checks the
+sentences match DeepSegment.segment_long's one-window-at-a-time loop. Then
+sends the same texts through the shared batcher from concurrent threads.
+
+cache: posts the same synthetic upload to /transcribe twice with the
+recognition cache backed by a SQLite file, and checks the repeat makes no
+recognizer calls (unintelligible chunks included). Then checks a fresh
+process is answered from the SQLite tier, that another language misses,
+and that both tiers miss once --ttl has passed.
+
+jobs: posts an upload to /jobs through the Flask test client, claims and
+processes it with jobs.process_job and checks GET /jobs/<id> at each step
+and that the result matches /transcribe. Then interrupts a running job,
+checks a restarted store re-queues it (requeue_running) and finishes it,
+opens the circuit breaker mid-job and checks the job goes back to the
+queue instead of failing, runs jobs.main with one worker and SIGKILLs it
+mid-job to check the replacement worker re-runs the job, and finally lets
+several worker processes claim from one queue at once and checks every job
+is claimed exactly once.
+
+suite: the regression suite. Each case runs in a fresh interpreter: a
+synthetic 16 kHz recording of each length (generated while it is uploaded)
+is posted to /transcribe through the Flask test client, with the recognizer
+replaced by FakeRecognizer (fixed latency, error_rate of the chunks
+unintelligible, words from benchmark_transcript.txt) and the cache disabled; a
+last case merges --merge-segments synthetic transcripts. Reports wall time,
+per-stage time, peak RSS, chunks per second and the effective recognition
+parallelism, and compares them with the JSON baseline: chunk counts and
+transcript hashes must match exactly, times and RSS may grow by at most
+--tolerance, parallelism may shrink by at most --tolerance. Any regression
+exits with status 1. Without a baseline file (or with --update-baseline)
+the results are written as the new baseline.
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import struct
+import threading
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import speech_recognition as sr
+from pydub import AudioSegment, silence
+
+import audio_io
+import ingest
+import vad
+from chunking import plan_chunks
+from recognition import RecognitionTimeout, recognize_chunks
+from transcript import merge_segments, normalize_whitespace
+
+SAMPLE_RATE = 16000
+SEED = 1234
+
+
+def synthetic_speech(seconds, sample_rate=SAMPLE_RATE, seed=SEED, bursts=(0.3, 6.0), gaps=(0.1, 2.0)):
+    """
+    Deterministic speech-like int16 audio: bursts of modulated tones (0.3-6 s)
+    separated by low-level noise gaps (0.1-2 s), so some gaps are shorter and
+    some longer than the 800 ms silence threshold. bursts and gaps set the
+    (min, max) lengths in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    out = (rng.normal(0, 30, total)).astype(np.float64)  # background hiss
+
+    pos = int(rng.uniform(0.1, 1.0) * sample_rate)
+    while pos < total:
+        burst = int(rng.uniform(*bursts) * sample_rate)
+        end = min(pos + burst, total)
+        t = np.arange(end - pos) / sample_rate
+        freq = rng.uniform(120, 400)
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(2, 6) * t)
+        out[pos:end] += rng.uniform(3000, 9000) * envelope * np.sin(2 * np.pi * freq * t)
+        pos = end + int(rng.uniform(*gaps) * sample_rate)
+
+    return np.clip(out, -32768, 32767).astype(np.int16)
+
+
+def to_segment(samples, sample_rate=SAMPLE_RATE):
+    return AudioSegment(samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1)
+
+
+def bench_vad(seconds):
+    samples = synthetic_speech(seconds)
+    audio = to_segment(samples)
+    settings = dict(min_silence_len=800, silence_thresh=audio.dBFS - 14, keep_silence=400)
+
+    t0 = time.perf_counter()
+    ranges = vad.split_on_silence(samples, SAMPLE_RATE, **settings)
+    numpy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reference = silence.split_on_silence(audio, **settings)
+    pydub_s = time.perf_counter() - t0
+
+    ours = [audio[start:end] for start, end in ranges]
+    assert len(ours) == len(reference), f"chunk count differs: {len(ours)} vs {len(reference)}"
+    for i, (a, b) in enumerate(zip(ours, reference)):
+        assert a.raw_data == b.raw_data, f"chunk {i} differs"
+
+    print(f"audio: {seconds}s, chunks: {len(ranges)} (identical to pydub)")
+    print(f"pydub split_on_silence: {pydub_s:8.3f}s")
+    print(f"vad.split_on_silence:   {numpy_s:8.3f}s  ({pydub_s / max(numpy_s, 1e-9):.0f}x faster)")
+
+
+class FakeRecognizer:
+    """
+    Stand-in for Recognizer.recognize_google: sleeps `latency` seconds per call
+    and returns "chunk <n>" for the n-th call, or "chunk <i>" when given a
+    plain chunk index i instead of AudioData (bench_recognize). The call
+    numbered fail_on raises RequestError straight away, like a rejected
+    request.
+
+    With vocab (a word list), returns about two words per second of audio
+    taken from it instead, and error_rate of the chunks raise
+    UnknownValueError. Both are picked from a hash of the audio, so results
+    don't depend on call order.
+    """
+
+    def __init__(self, latency=0.2, fail_on=None, error_rate=0.0, vocab=None):
+        self.latency = latency
+        self.fail_on = fail_on
+        self.error_rate = error_rate
+        self.vocab = vocab
+        self.calls = 0
+        self.unintelligible = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, audio_data, language="en-US"):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        if n == self.fail_on:
+            raise sr.RequestError("fake upstream failure")
+        time.sleep(self.latency)
+        if self.vocab is None:
+            return f"chunk {audio_data if isinstance(audio_data, int) else n}"
+
+        digest = zlib.crc32(audio_data.frame_data)
+        if (digest % 10000) < self.error_rate * 10000:
+            with self._lock:
+                self.unintelligible += 1
+            raise sr.UnknownValueError()
+        seconds = len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width)
+        start = digest % len(self.vocab)
+        return " ".join(self.vocab[(start + i) % len(self.vocab)] for i in range(max(1, int(seconds * 2))))
+
+
+def bench_recognize(chunks, latency, workers):
+    audio_chunks = list(range(chunks))
+
+    fake = FakeRecognizer(latency)
+    t0 = time.perf_counter()
+    serial = recognize_chunks(audio_chunks, fake, "kn-IN", max_workers=1)
+    serial_s = time.perf_counter() - t0
+
+    fake = FakeRecognizer(latency)
+    t0 = time.perf_counter()
+    parallel = recognize_chunks(audio_chunks, fake, "kn-IN", max_workers=workers)
+    parallel_s = time.perf_counter() - t0
+
+    assert parallel == serial == [f"chunk {i}" for i in audio_chunks], "results out of order"
+    print(f"{chunks} chunks @ {latency}s: serial {serial_s:.2f}s, "
+          f"{workers} workers {parallel_s:.2f}s ({serial_s / parallel_s:.1f}x)")
+
+    # first call fails -> only the calls already in flight may still run
+    fake = FakeRecognizer(latency, fail_on=1)
+    try:
+        recognize_chunks(audio_chunks, fake, "kn-IN", max_workers=workers)
+        raise AssertionError("RequestError was swallowed")
+    except sr.RequestError:
+        pass
+    time.sleep(latency * 2)
+    assert fake.calls <= workers, f"{fake.calls} calls made after failure"
+    print(f"RequestError: stopped after {fake.calls}/{chunks} calls")
+
+    fake = FakeRecognizer(latency)
+    t0 = time.perf_counter()
+    try:
+        recognize_chunks(audio_chunks, fake, "kn-IN", max_workers=workers, timeout=latency * 1.5)
+        raise AssertionError("deadline was ignored")
+    except RecognitionTimeout:
+        waited = time.perf_counter() - t0
+    time.sleep(latency * 2)
+    assert waited < latency * 2, f"returned {waited:.2f}s after start"
+    assert fake.calls <= workers * 2, f"{fake.calls} calls made after deadline"
+    print(f"deadline: returned after {waited:.2f}s, {fake.calls}/{chunks} calls made")
+
+
+@contextlib.contextmanager
+def override_config(**values):
+    """Set app.config values for the duration of a check, restoring the previous ones after."""
+    import app as stt_app
+
+    old = {key: stt_app.app.config[key] for key in values}
+    stt_app.app.config.update(values)
+    try:
+        yield
+    finally:
+        stt_app.app.config.update(old)
+
+
+def wav_bytes(samples, sample_rate=SAMPLE_RATE):
+    buf = io.BytesIO()
+    to_segment(samples, sample_rate).export(buf, format="wav")
+    return buf.getvalue()
+
+
+def check_tempfiles(seconds):
+    import app as stt_app
+
+    upload = wav_bytes(synthetic_speech(seconds))
+    seen = []
+
+    def spy(audio_data, language="en-US"):
+        seen.append(os.listdir(tempfile.gettempdir()))
+        return "ok"
+
+    old_tempdir = tempfile.tempdir
+    with tempfile.TemporaryDirectory() as scratch, override_config(STT_RECOGNIZER=spy):
+        tempfile.tempdir = scratch
+        try:
+            client = stt_app.app.test_client()
+            response = client.post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+            after = os.listdir(scratch)
+        finally:
+            tempfile.tempdir = old_tempdir
+
+    assert response.status_code == 200, response.get_json()
+    assert seen, "recognizer was never called"
+    created = sorted({name for names in seen for name in names} | set(after))
+    assert not created, f"temp files created during request: {created}"
+    print(f"{len(upload) / 1e6:.1f} MB upload, {len(seen)} chunks: no temp files created")
+
+
+def legacy_merge(transcripts, max_overlap_words=3):
+    """The original merger: re-splits the whole merged string at every boundary."""
+    if not transcripts:
+        return ""
+    merged = transcripts[0].strip()
+    for nxt in transcripts[1:]:
+        prev_words = merged.split()
+        next_words = nxt.strip().split()
+        overlap_found = 0
+        for k in range(max_overlap_words, 0, -1):
+            if len(prev_words) >= k and len(next_words) >= k:
+                if prev_words[-k:] == next_words[:k]:
+                    overlap_found = k
+                    break
+        merged += " " + " ".join(next_words[overlap_found:])
+    return normalize_whitespace(merged)
+
+
+def transcript_words():
+    """
+    Words of benchmark_transcript.txt, a fixed copy of a real Kannada
+    transcript (test_api.py overwrites full_transcript.txt).
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_transcript.txt"),
+              encoding="utf-8") as f:
+        return f.read().split()
+
+
+def synthetic_transcripts(segments, seed=SEED):
+    """
+    segments chunk transcripts cut from benchmark_transcript.txt (cycled), each
+    repeating 0-3 words from the end of the previous one like overlapping
+    chunk audio does.
+    """
+    vocab = transcript_words()
+    rng = np.random.default_rng(seed)
+    out = []
+    pos = 0
+    for _ in range(segments):
+        n = int(rng.integers(5, 40))
+        repeat = int(rng.integers(0, 4)) if out else 0
+        words = [vocab[i % len(vocab)] for i in range(pos - repeat, pos + n)]
+        out.append(" ".join(words))
+        pos += n
+    return out
+
+
+def bench_merge(segments):
+    transcripts = synthetic_transcripts(segments)
+    n_words = sum(len(t.split()) for t in transcripts)
+
+    t0 = time.perf_counter()
+    merged, timed = merge_segments((i, i + 1, t) for i, t in enumerate(transcripts))
+    new_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reference = legacy_merge(transcripts)
+    legacy_s = time.perf_counter() - t0
+
+    assert merged == reference, "merged transcript differs from the previous merger"
+    assert len(timed) == len(transcripts)
+    print(f"{segments} segments, {n_words} words (identical output)")
+    print(f"previous merger:        {legacy_s:8.3f}s")
+    print(f"merge_segments:         {new_s:8.3f}s  ({legacy_s / max(new_s, 1e-9):.0f}x faster)")
+
+
+def bench_plan(pieces, seed=SEED):
+    # many tiny speech pieces separated by ~1s pauses
+    rng = np.random.default_rng(seed)
+    ranges = []
+    pos = 0
+    for _ in range(pieces):
+        length = int(rng.integers(800, 1500))
+        ranges.append([pos, pos + length])
+        pos += length + int(rng.integers(900, 1200))
+    samples = np.zeros(pos * SAMPLE_RATE // 1000, dtype=np.int16)
+    audio = to_segment(samples)
+
+    t0 = time.perf_counter()
+    spans = plan_chunks(ranges, len(audio))
+    chunks = [audio_io.slice_ms(samples, start, end) for start, end in spans]
+    new_s = time.perf_counter() - t0
+
+    # the original packing: concatenate AudioSegments, copying as it grows
+    t0 = time.perf_counter()
+    legacy = []
+    current = AudioSegment.silent(duration=0, frame_rate=SAMPLE_RATE)
+    overlap = AudioSegment.silent(duration=500, frame_rate=SAMPLE_RATE)
+    for start, end in ranges:
+        chunk = audio[start:end]
+        if len(current) + len(chunk) <= 30000:
+            current += chunk
+        else:
+            legacy.append(current)
+            current = chunk
+        current += overlap
+    legacy.append(current)
+    legacy_s = time.perf_counter() - t0
+
+    print(f"{pieces} pieces over {len(audio) / 1000:.0f}s audio -> {len(chunks)} chunks "
+          f"(previous packing: {len(legacy)})")
+    print(f"AudioSegment concatenation: {legacy_s:8.3f}s")
+    print(f"plan_chunks + slicing:      {new_s:8.3f}s  ({legacy_s / max(new_s, 1e-9):.0f}x faster)")
+
+
+STARTUP_PROBE = """
+import json, resource, time
+t0 = time.perf_counter()
+import app, punctuation
+print(json.dumps({
+    "import_s": time.perf_counter() - t0,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "model_loaded": punctuation._segmenter is not None,
+}))
+"""
+
+
+def bench_startup():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, preload in (("lazy (default)", ""), ("preloaded", "1")):
+        env = dict(os.environ, STT_PRELOAD_PUNCTUATION=preload)
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE], cwd=here, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        note = "" if probe["model_loaded"] or not preload else "  (DeepSegment not installed)"
+        print(f"{label:15} import {probe['import_s']:6.2f}s  peak RSS {probe['max_rss_mb']:7.1f} MB{note}")
+
+
+class SyntheticWavStream:
+    """
+    Read-only WAV file of synthetic speech that is generated as it is read,
+    so arbitrarily long recordings don't have to exist in memory.
+    """
+
+    def __init__(self, seconds, sample_rate=44100, channels=2, block_seconds=10, gaps=(0.1, 2.0)):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_seconds = block_seconds
+        self.gaps = gaps
+        self.frames = int(seconds * sample_rate)
+        data_bytes = self.frames * channels * 2
+        self._pending = struct.pack(
+            "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1, channels,
+            sample_rate, sample_rate * channels * 2, channels * 2, 16, b"data", data_bytes,
+        )
+        self.size = len(self._pending) + data_bytes
+        self._block = 0
+        self._frames_left = self.frames
+
+    def _next_block(self):
+        n = min(self.block_seconds * self.sample_rate, self._frames_left)
+        mono = synthetic_speech(self.block_seconds, self.sample_rate, seed=SEED + self._block, gaps=self.gaps)[:n]
+        self._block += 1
+        self._frames_left -= n
+        # second channel slightly quieter so the downmix is not a no-op
+        frames = np.stack([mono] + [(mono * 0.8).astype(np.int16)] * (self.channels - 1), axis=1)
+        return frames.tobytes()
+
+    def read(self, n=-1):
+        while (n is None or n < 0 or len(self._pending) < n) and self._frames_left > 0:
+            self._pending += self._next_block()
+        if n is None or n < 0:
+            n = len(self._pending)
+        data, self._pending = self._pending[:n], self._pending[n:]
+        return data
+
+
+class MultipartUpload:
+    """multipart/form-data body with `stream` as its "audio" file, generated as it is read."""
+
+    def __init__(self, stream, size, filename="in.wav", boundary="benchmark-boundary"):
+        head = (f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.size = len(head) + size + len(tail)
+        self._parts = collections.deque([io.BytesIO(head), stream, io.BytesIO(tail)])
+
+    def read(self, n=-1):
+        data = b""
+        while self._parts and (n is None or n < 0 or len(data) < n):
+            more = self._parts[0].read(-1 if n is None or n < 0 else n - len(data))
+            if not more:
+                self._parts.popleft()
+            data += more
+        return data
+
+
+def post_stream(wsgi_app, path, stream, content_type, content_length):
+    """POST a stream that is generated as it is read through a WSGI app; returns (status, JSON payload)."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    environ = EnvironBuilder(path, method="POST", content_type=content_type).get_environ()
+    # the test client only accepts seekable streams (and would replace a multipart boundary)
+    environ.update({"wsgi.input": stream, "CONTENT_TYPE": content_type, "CONTENT_LENGTH": str(content_length)})
+    app_iter, status, _ = run_wsgi_app(wsgi_app, environ, buffered=True)
+    return int(status.split()[0]), json.loads(b"".join(app_iter))
+
+
+def bench_ingest(minutes):
+    # 1) decoded samples match pydub's from_wav -> mono -> 16 kHz -> 16-bit
+    for label, rate, channels, width in (("44.1 kHz stereo 16-bit", 44100, 2, 2),
+                                         ("22.05 kHz mono 8-bit", 22050, 1, 1),
+                                         ("48 kHz mono 24-bit", 48000, 1, 3)):
+        stream = SyntheticWavStream(20, rate, channels)
+        segment = AudioSegment.from_file(io.BytesIO(stream.read()), format="wav").set_sample_width(width)
+        wav = io.BytesIO()
+        segment.export(wav, format="wav")
+        wav = wav.getvalue()
+
+        expected = (AudioSegment.from_wav(io.BytesIO(wav))
+                    .set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2).raw_data)
+        decoded = np.concatenate(list(ingest.iter_pcm(io.BytesIO(wav)))).tobytes()
+        assert decoded == expected, f"{label}: streamed samples differ from pydub"
+        print(f"{label}: streamed decode identical to pydub")
+
+    # 2) shorter than one window: same chunks as a whole-file pass
+    samples = synthetic_speech(240)
+    ranges, _ = vad.segment(samples, SAMPLE_RATE, min_silence_len=800, silence_offset_db=14, keep_silence=400)
+    expected = plan_chunks(ranges, vad.duration_ms(samples, SAMPLE_RATE))
+    chunks = ingest.ChunkStream(io.BytesIO(wav_bytes(samples)))
+    for _ in chunks:
+        pass
+    assert chunks.spans == expected, "streamed chunks differ from a whole-file pass"
+    print(f"240s upload: {len(expected)} chunks identical to a whole-file pass")
+
+    # with a short first window the first chunk comes out early, edges stay close
+    firsts = {}
+    for first_window in (None, ingest.FIRST_WINDOW_SECONDS):
+        chunks = ingest.ChunkStream(io.BytesIO(wav_bytes(samples)), first_window_seconds=first_window)
+        for i, _ in enumerate(chunks):
+            if not i:
+                firsts[first_window] = chunks.decoded_ms / 1000
+    assert firsts[ingest.FIRST_WINDOW_SECONDS] <= ingest.FIRST_WINDOW_SECONDS + ingest.BLOCK_SECONDS, firsts
+    assert len(chunks.spans) == len(expected), f"first window {chunks.spans}, whole-file {expected}"
+    drift = max(abs(a - b) for span, other in zip(chunks.spans, expected) for a, b in zip(span, other))
+    print(f"first chunk after {firsts[None]:.0f}s of decoded audio, {firsts[ingest.FIRST_WINDOW_SECONDS]:.0f}s "
+          f"with a {ingest.FIRST_WINDOW_SECONDS:.0f}s first window ({len(expected)} chunks, edges within {drift} ms)")
+
+    # 3) a pause longer than a chunk is not cut into chunks of silence
+    first, last = (synthetic_speech(20, seed=seed, gaps=(0.1, 0.5)) for seed in (SEED, SEED + 1))
+    hiss = np.random.default_rng(SEED).normal(0, 30, 290 * SAMPLE_RATE).astype(np.int16)
+    samples = np.concatenate([first, hiss, last])
+    ranges, _ = vad.segment(samples, SAMPLE_RATE, min_silence_len=800, silence_offset_db=14, keep_silence=400)
+    expected = plan_chunks(ranges, vad.duration_ms(samples, SAMPLE_RATE))
+    chunks = ingest.ChunkStream(io.BytesIO(wav_bytes(samples)))
+    for _ in chunks:
+        pass
+    # the silence threshold follows the loudness decoded so far, so edges may move a few ms
+    assert len(chunks.spans) == len(expected), f"streamed {chunks.spans}, whole-file {expected}"
+    drift = max(abs(a - b) for span, other in zip(chunks.spans, expected) for a, b in zip(span, other))
+    assert drift <= 100, f"streamed {chunks.spans}, whole-file {expected}"
+    print(f"20s speech, 290s pause, 20s speech: {len(expected)} chunks like a whole-file pass "
+          f"(edges within {drift} ms)")
+
+    # 4) long recording: memory is bounded by the window, not the length
+    stream = SyntheticWavStream(minutes * 60)
+    decoded_mb = stream.frames * SAMPLE_RATE / stream.sample_rate * 2 / 1e6
+    upload_mb = stream.frames * stream.channels * 2 / 1e6
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    chunks = ingest.ChunkStream(stream, max_seconds=minutes * 60 + 1)
+    longest = 0
+    for audio_data in chunks:
+        longest = max(longest, len(audio_data.frame_data))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{minutes} min 44.1 kHz stereo ({upload_mb:.0f} MB WAV, {decoded_mb:.0f} MB as 16 kHz mono): "
+          f"{len(chunks.spans)} chunks in {elapsed:.1f}s")
+    print(f"peak traced memory {peak / 1e6:.1f} MB (window {ingest.WINDOW_SECONDS:.0f}s, "
+          f"largest chunk {longest / 1e6:.1f} MB)")
+
+    try:
+        for _ in ingest.ChunkStream(SyntheticWavStream(120), max_seconds=60):
+            pass
+        raise AssertionError("duration limit was ignored")
+    except ingest.AudioTooLong as e:
+        print(f"duration limit: {e}")
+
+    # 5) the same through /transcribe: a multipart upload is not buffered before decoding
+    import app as stt_app
+    from cache import RecognitionCache
+
+    seconds = min(minutes, 20) * 60
+    peaks = {}
+    with override_config(STT_RECOGNIZER=FakeRecognizer(0), STT_CACHE=RecognitionCache(max_entries=0),
+                         STT_REQUEST_DEADLINE=3600.0):
+        for label in ("raw body", "multipart"):
+            wav = SyntheticWavStream(seconds)
+            body, content_type = wav, "audio/wav"
+            if label == "multipart":
+                body = MultipartUpload(wav, wav.size)
+                content_type = body.content_type
+            tracemalloc.start()
+            status, payload = post_stream(stt_app.app, "/transcribe", body, content_type, body.size)
+            _, peaks[label] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert status == 200, payload
+    print(f"/transcribe, {wav.size / 1e6:.0f} MB WAV: peak traced memory "
+          + ", ".join(f"{label} {peak / 1e6:.1f} MB" for label, peak in peaks.items()))
+    assert peaks["multipart"] < peaks["raw body"] + 16e6, "the multipart upload was buffered"
+
+    # a multipart body cut off part way is the client's fault, not ours
+    wav = SyntheticWavStream(60)
+    body = MultipartUpload(wav, wav.size)
+    full = body.read()
+    with override_config(STT_RECOGNIZER=FakeRecognizer(0), STT_CACHE=RecognitionCache(max_entries=0)):
+        errors = []
+        for cut in (len(full) // 2, 100):
+            status, payload = post_stream(stt_app.app, "/transcribe", io.BytesIO(full[:cut]), body.content_type, cut)
+            assert status == 400, (cut, status, payload)
+            errors.append(payload["error"])
+    print(f"multipart body cut off in the audio or in its headers: 400 ({'; '.join(errors)})")
+
+
+def tone_chunk(index, seconds=2.0):
+    """A tone whose peak amplitude (1000 + 100 * index) identifies the chunk."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return ((1000 + 100 * index) * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def serve_app(wsgi_app):
+    """Run a WSGI app on a free local port in a background thread; returns (server, base_url)."""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no per-request log lines
+    server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def chunk_index(audio_data):
+    return int(round((np.frombuffer(audio_data.frame_data, dtype=np.int16).max() - 1000) / 100))
+
+
+def bench_client(chunks, latency, in_flight):
+    import requests
+
+    import app as stt_app
+    from cache import RecognitionCache
+    from client import STTClient, encode_flac
+
+    def recognize(audio_data, language="en-US"):
+        index = chunk_index(audio_data)
+        # every third chunk is three times slower
+        time.sleep(latency * (1 + 2 * (index % 3 == 2)))
+        return f"chunk {index}"
+
+    failures = {"every": 0, "sent": 0, "count": 0}
+
+    def flaky(wsgi_app):
+        lock = threading.Lock()
+
+        def middleware(environ, start_response):
+            with lock:
+                failures["count"] += 1
+                fail = failures["every"] and failures["count"] % failures["every"] == 0
+                failures["sent"] += fail
+            if fail:
+                start_response("503 Service Unavailable", [("Content-Type", "application/json")])
+                return [b'{"error": "overloaded"}']
+            return wsgi_app(environ, start_response)
+        return middleware
+
+    audio_chunks = [tone_chunk(i) for i in range(chunks)]
+    expected = [f"chunk {i}" for i in range(chunks)]
+    # every upload must reach the recognizer
+    with override_config(STT_RECOGNIZER=recognize, STT_CACHE=RecognitionCache(max_entries=0)):
+        server, base_url = serve_app(flaky(stt_app.app))
+        url = f"{base_url}/transcribe"
+        try:
+            # previous client: one new connection and one WAV per chunk, in turn
+            t0 = time.perf_counter()
+            serial = []
+            for chunk in audio_chunks:
+                response = requests.post(f"{url}?lang=kn-IN", files={"audio": ("chunk.wav", wav_bytes(chunk))})
+                serial.append(response.json()["transcript"])
+            serial_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            with STTClient(url, "kn-IN", max_in_flight=in_flight) as client:
+                pipelined = client.transcribe_chunks(audio_chunks)
+            pipelined_s = time.perf_counter() - t0
+
+            failures["every"] = 4
+            with STTClient(url, "kn-IN", max_in_flight=in_flight, backoff=0.05) as client:
+                retried = client.transcribe_chunks(audio_chunks)
+        finally:
+            server.shutdown()
+
+    assert serial == pipelined == expected, "results out of order"
+    assert retried == expected, "retries lost chunks"
+    slowest = latency * 3
+    print(f"{chunks} chunks, recognition {latency:.2f}-{slowest:.2f}s each: "
+          f"sequential {serial_s:.2f}s, {in_flight} in flight {pipelined_s:.2f}s "
+          f"(slowest chunk {slowest:.2f}s, {serial_s / pipelined_s:.1f}x)")
+    print(f"503 on every 4th upload: {failures['sent']} retried, all {chunks} texts in order")
+
+    speech = synthetic_speech(20)
+    print(f"upload size for 20s of synthetic speech: WAV {len(wav_bytes(speech)) / 1e3:.0f} kB, "
+          f"FLAC {len(encode_flac(speech)) / 1e3:.0f} kB")
+
+
+class ThrottledStream:
+    """Readable over `data` that hands out at most bytes_per_second, like a slow upload."""
+
+    def __init__(self, data, bytes_per_second):
+        self._data = io.BytesIO(data)
+        self._rate = bytes_per_second
+        self._sent = 0
+        self._started = None
+
+    def read(self, n=-1):
+        if self._started is None:
+            self._started = time.monotonic()
+        n = 1 << 16 if n is None or n < 0 else min(n, 1 << 16)
+        due = self._started + (self._sent + n) / self._rate
+        time.sleep(max(0.0, due - time.monotonic()))
+        data = self._data.read(n)
+        self._sent += len(data)
+        return data
+
+
+def sse_events(wsgi_app, path, stream, content_type, content_length):
+    """POST through a WSGI app and read the Server-Sent Events as they come: [(seconds, event, data)]."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    environ = EnvironBuilder(path, method="POST", content_type=content_type).get_environ()
+    environ.update({"wsgi.input": stream, "CONTENT_TYPE": content_type, "CONTENT_LENGTH": str(content_length)})
+    t0 = time.monotonic()
+    app_iter, status, _ = run_wsgi_app(wsgi_app, environ)
+    assert status.startswith("200"), status
+    events, pending = [], ""
+    for block in app_iter:
+        pending += block.decode() if isinstance(block, bytes) else block
+        while "\n\n" in pending:
+            message, pending = pending.split("\n\n", 1)
+            lines = dict(line.split(": ", 1) for line in message.splitlines())
+            events.append((time.monotonic() - t0, lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def check_stream(seconds, latency):
+    import app as stt_app
+    from cache import RecognitionCache
+
+    # chunks one after another, so each chunk event is one recognition after the previous one
+    samples = synthetic_speech(seconds)
+    upload = wav_bytes(samples)
+    config = dict(STT_CACHE=RecognitionCache(max_entries=0), STT_MAX_CONCURRENCY=1)
+    with override_config(STT_RECOGNIZER=FakeRecognizer(latency, vocab=transcript_words()), **config):
+        events = sse_events(stt_app.app, "/transcribe/stream", io.BytesIO(upload), "audio/wav", len(upload))
+        whole = stt_app.app.test_client().post("/transcribe", data=upload, content_type="audio/wav").get_json()
+
+    kinds = [event for _, event, _ in events]
+    assert kinds == ["chunk"] * (len(kinds) - 1) + ["done"], kinds
+    chunks = [(t, data) for t, event, data in events if event == "chunk"]
+    done = events[-1][2]
+    assert sorted(data["index"] for _, data in chunks) == list(range(whole["timing"]["chunks"]))
+    for _, data in chunks:
+        segment = whole["segments"][data["index"]]
+        assert (data["start_ms"], data["end_ms"], data["text"]) == \
+            (segment["start_ms"], segment["end_ms"], segment["text"]), (data, segment)
+    for key in ("transcript", "segments", "cache"):
+        assert done[key] == whole[key], f"done {key} differs from /transcribe"
+    first = chunks[0][0]
+    assert first < latency * 1.5 + 0.2, f"first chunk after {first:.2f}s"
+    print(f"{seconds:.0f}s upload, {latency:.2f}s per chunk, one at a time: {len(chunks)} chunk events at "
+          + ", ".join(f"{t:.2f}s" for t, _ in chunks) + f"; done equals /transcribe")
+
+    # a recognizer error ends the stream
+    with override_config(STT_RECOGNIZER=FakeRecognizer(latency, fail_on=2), STT_RETRIES=0, **config):
+        events = sse_events(stt_app.app, "/transcribe/stream", io.BytesIO(upload), "audio/wav", len(upload))
+    kinds = [event for _, event, _ in events]
+    assert set(kinds[:-1]) <= {"chunk"} and kinds[-1] == "error", kinds
+    assert "Google API error" in events[-1][2]["error"], events[-1]
+    print(f"RequestError on the 2nd chunk: events {kinds}, {events[-1][2]['error']!r}")
+
+    # a long upload arriving slowly: the first text comes after the first window, not the whole upload
+    long_upload = wav_bytes(synthetic_speech(240))
+    upload_s = 4.0
+    with override_config(STT_RECOGNIZER=FakeRecognizer(latency), **config):
+        body = ThrottledStream(long_upload, len(long_upload) / upload_s)
+        events = sse_events(stt_app.app, "/transcribe/stream", body, "audio/wav", len(long_upload))
+    first = next(t for t, event, _ in events if event == "chunk")
+    window_s = upload_s * stt_app.app.config["STT_STREAM_FIRST_WINDOW"] / 240
+    assert events[-1][1] == "done", events[-1]
+    assert first < window_s + latency + 0.5, f"first chunk after {first:.2f}s"
+    print(f"240s upload sent over {upload_s:.0f}s: first chunk event after {first:.2f}s "
+          f"(first window uploaded after {window_s:.2f}s), done after {events[-1][0]:.2f}s")
+
+
+def bench_live(seconds, latency):
+    import app as stt_app
+    from cache import RecognitionCache
+    from client import STTClient, replay_frames
+
+    def recognize(audio_data, language="en-US"):
+        time.sleep(latency)
+        return f"{len(audio_data.frame_data) // 32} ms"
+
+    for content_type in ("audio/L16; rate=8000", "audio/L16; rate=abc", "audio/wav"):
+        response = stt_app.app.test_client().post("/transcribe/live", data=b"\0" * 3200, content_type=content_type)
+        assert response.status_code == 415 and "error" in response.get_json(), (content_type, response.status)
+
+    samples = synthetic_speech(seconds)
+    received = []
+    with override_config(STT_RECOGNIZER=recognize, STT_CACHE=RecognitionCache(max_entries=0)):
+        server, base_url = serve_app(stt_app.app)
+        try:
+            with STTClient(f"{base_url}/transcribe", "kn-IN") as client:
+                started = time.monotonic()
+                result = client.stream_live(replay_frames(samples),
+                                            on_segment=lambda s: received.append((time.monotonic(), s)))
+                finished = time.monotonic() - started
+        finally:
+            server.shutdown()
+
+    keep_silence, min_silence = 300, 800
+    assert received, "no segments came back"
+    assert len(received) == len(result["segments"]), "segment events and final payload disagree"
+
+    # latency from the last word of an utterance leaving the fake microphone
+    # to its text arriving; the final segment is closed by the end of the upload
+    latencies = []
+    for arrived, segment in received:
+        speech_end = (segment["end_ms"] - keep_silence) / 1000
+        if segment["end_ms"] < vad.duration_ms(samples, SAMPLE_RATE):
+            latencies.append(arrived - started - speech_end)
+    bound = min_silence / 1000 + latency + 0.3  # + one frame of capture and of reading
+    early = sum(arrived - started < seconds for arrived, _ in received)
+    print(f"{seconds:.0f}s replayed live: {len(received)} segments, {early} delivered before the upload ended, "
+          f"done {finished - seconds:.2f}s after it")
+    print(f"end of utterance -> text: median {np.median(latencies):.2f}s, max {max(latencies):.2f}s "
+          f"(bound {bound:.2f}s = {min_silence} ms silence + {latency:.2f}s recognition + 0.3s)")
+    assert max(latencies) < bound, "a segment took longer than one silence timeout plus one recognition"
+
+    ranges, _ = vad.segment(samples, SAMPLE_RATE, min_silence_len=min_silence, keep_silence=keep_silence)
+    summary = f"whole-file split: {len(ranges)} pieces, live: {len(received)} segments"
+    if len(ranges) == len(received):
+        live_spans = [(s["start_ms"], s["end_ms"]) for s in result["segments"]]
+        drift = max(abs(a - b) for r, span in zip(ranges, live_spans) for a, b in zip(r, span))
+        summary += f", boundaries within {drift} ms"
+    print(summary)
+
+    # a session outlasting the request deadline still waits for tokens and retries
+    from admission import TokenBucket
+
+    attempts = collections.Counter()
+
+    def flaky(audio_data, language="en-US"):
+        key = bytes(audio_data.frame_data[:64])
+        attempts[key] += 1
+        if attempts[key] == 1:
+            raise sr.RequestError("fake transient failure")
+        time.sleep(latency)
+        return "ok"
+
+    deadline = 4.0
+    received = []
+    with override_config(STT_RECOGNIZER=flaky, STT_CACHE=RecognitionCache(max_entries=0),
+                         STT_REQUEST_DEADLINE=deadline, STT_RATE_LIMITER=TokenBucket(20, burst=1),
+                         STT_RETRY_BACKOFF=0.05):
+        server, base_url = serve_app(stt_app.app)
+        try:
+            with STTClient(f"{base_url}/transcribe", "kn-IN") as client:
+                speech = synthetic_speech(12, seed=SEED + 1, bursts=(0.5, 1.5), gaps=(1.0, 1.5))
+                client.stream_live(replay_frames(speech), on_segment=received.append)
+        finally:
+            server.shutdown()
+    late = sum(s["start_ms"] > deadline * 1000 for s in received)
+    assert received and all(s["text"] == "ok" for s in received), received
+    print(f"12s session, {deadline:.0f}s request deadline, rate limit and a failed first attempt per segment: "
+          f"all {len(received)} segments retried and recognized ({late} after the deadline)")
+
+
+def metrics_worker(db_path, requests_per_worker, seed):
+    os.environ["STT_METRICS_DB"] = db_path
+    import app as stt_app
+
+    stt_app.app.config["STT_RECOGNIZER"] = FakeRecognizer(0.01)
+    client = stt_app.app.test_client()
+    for k in range(requests_per_worker):
+        upload = wav_bytes(synthetic_speech(20, seed=seed * 100 + k))
+        response = client.post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+        assert response.status_code == 200, response.get_json()
+
+
+def check_metrics(workers, requests_per_worker):
+    import multiprocessing
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, "metrics.db")
+        ctx = multiprocessing.get_context("spawn")  # fresh interpreters, like gunicorn workers
+        procs = [ctx.Process(target=metrics_worker, args=(db_path, requests_per_worker, i))
+                 for i in range(workers)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            assert proc.exitcode == 0, f"worker exited with {proc.exitcode}"
+
+        # read back in yet another process
+        text = subprocess.run(
+            [sys.executable, "-c", "import app; print(app.app.test_client().get('/metrics').get_data(as_text=True))"],
+            env=dict(os.environ, STT_METRICS_DB=db_path), capture_output=True, text=True, check=True,
+        ).stdout
+
+    samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+    total = workers * requests_per_worker
+    assert float(samples['stt_requests_total{endpoint="transcribe",status="200"}']) == total
+    assert float(samples["stt_audio_seconds_total"]) == total * 20
+    assert float(samples['stt_stage_seconds_count{stage="decode"}']) == total
+    stages = sorted({key.split('"')[1] for key in samples if key.startswith("stt_stage_seconds_count")})
+    print(f"{workers} workers x {requests_per_worker} requests: /metrics reports {total} requests, "
+          f"{total * 20}s of audio; stages {', '.join(stages)}")
+
+    import app as stt_app
+
+    client = stt_app.app.test_client()
+
+    def post_profiled():
+        return client.post(
+            "/transcribe?profile=1", data={"audio": (io.BytesIO(wav_bytes(synthetic_speech(20))), "in.wav")}
+        )
+
+    with override_config(STT_RECOGNIZER=FakeRecognizer(0.01), STT_ALLOW_PROFILE=False):
+        assert "profile" not in post_profiled().get_json(), "profiled without STT_ALLOW_PROFILE"
+        stt_app.app.config["STT_ALLOW_PROFILE"] = True
+        response = post_profiled()
+    payload = response.get_json()
+    assert "cumulative" in payload["profile"], "no profile attached"
+    print(f"?profile=1: {len(payload['profile'].splitlines())} line cProfile summary, "
+          f"Server-Timing: {response.headers['Server-Timing']}")
+
+
+class QuotaUpstream:
+    """
+    Stand-in for the recognition endpoint, served over HTTP so every worker
+    process shares it: 429 once `quota` calls were accepted in the last
+    second, 500 to everything while `down`, otherwise "ok" after `latency`.
+    """
+
+    def __init__(self, quota, latency):
+        self.quota = quota
+        self.latency = latency
+        self.down = False
+        self.reset()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.accepted = self.rejected = self.failed = 0
+        self.peak = 0  # most calls accepted within one second
+        self._recent = collections.deque()
+
+    def __call__(self, environ, start_response):
+        environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if self.down:
+                self.failed += 1
+                status = "500 Internal Server Error"
+            elif len(self._recent) >= self.quota:
+                self.rejected += 1
+                status = "429 Too Many Requests"
+            else:
+                self._recent.append(now)
+                self.accepted += 1
+                self.peak = max(self.peak, len(self._recent))
+                status = "200 OK"
+        if status.startswith("200"):
+            time.sleep(self.latency)
+        start_response(status, [("Content-Type", "text/plain")])
+        return [b"ok"]
+
+
+def upstream_recognizer(url):
+    """Recognizer that calls a QuotaUpstream, failing like recognize_google does."""
+    import urllib.error
+    import urllib.request
+
+    def recognize(audio_data, language="en-US"):
+        try:
+            with urllib.request.urlopen(url, data=str(len(audio_data.frame_data)).encode(), timeout=10) as response:
+                return response.read().decode()
+        except urllib.error.HTTPError as e:
+            raise sr.RequestError(f"recognition request failed: {e.reason}")
+    return recognize
+
+
+def admission_worker(upstream_url, db_path, rate, max_wait, requests_per_worker, seed, results):
+    import app as stt_app
+    from admission import TokenBucket
+    from cache import RecognitionCache
+
+    stt_app.app.config.update(
+        STT_RECOGNIZER=upstream_recognizer(upstream_url),
+        STT_CACHE=RecognitionCache(max_entries=0),
+        STT_RATE_LIMITER=TokenBucket(rate, burst=1, db_path=db_path) if rate else None,
+        STT_RATE_MAX_WAIT=max_wait,
+        STT_RETRY_BACKOFF=0.2,
+    )
+    upload = wav_bytes(synthetic_speech(60, seed=seed))  # 3 chunks
+
+    def post():
+        response = stt_app.app.test_client().post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+        stages = response.get_json()["timing"]["stages"]
+        results.put((response.status_code, response.headers.get("Retry-After"), "recognizer_calls" in stages))
+
+    # each worker receives a request every 0.3s
+    threads = []
+    for _ in range(requests_per_worker):
+        threads.append(threading.Thread(target=post))
+        threads[-1].start()
+        time.sleep(0.3)
+    for thread in threads:
+        thread.join()
+
+
+def check_admission(workers, requests_per_worker, quota, latency):
+    import multiprocessing
+
+    import app as stt_app
+    from admission import CircuitBreaker
+    from cache import RecognitionCache
+    from client import STTClient
+
+    upstream = QuotaUpstream(quota, latency)
+    server, base_url = serve_app(upstream)
+    ctx = multiprocessing.get_context("spawn")  # fresh interpreters, like gunicorn workers
+    max_wait = 3.0
+    total = workers * requests_per_worker
+    try:
+        for rate in (0, quota * 0.8):
+            upstream.reset()
+            with tempfile.TemporaryDirectory() as scratch:
+                results = ctx.Queue()
+                args = (base_url, os.path.join(scratch, "ratelimit.db"), rate, max_wait, requests_per_worker)
+                t0 = time.perf_counter()
+                procs = [ctx.Process(target=admission_worker, args=args + (i, results)) for i in range(workers)]
+                for proc in procs:
+                    proc.start()
+                outcomes = [results.get(timeout=120) for _ in range(total)]
+                for proc in procs:
+                    proc.join()
+                wall = time.perf_counter() - t0
+
+            statuses = collections.Counter(status for status, _, _ in outcomes)
+            label = f"shared limit {rate:g}/s" if rate else "no limit"
+            print(f"{label:<18} {total} requests in {wall:5.1f}s: {dict(sorted(statuses.items()))}; "
+                  f"upstream accepted {upstream.accepted}, rejected {upstream.rejected}, "
+                  f"peak {upstream.peak} calls/s (quota {quota})")
+            if not rate:
+                assert upstream.rejected, "the load never exceeded the quota"
+                continue
+            assert upstream.rejected == 0, "the shared limiter let calls over the quota through"
+            assert set(statuses) <= {200, 429}, f"unexpected statuses {statuses}"
+            assert all(retry for status, retry, _ in outcomes if status == 429), "429 without Retry-After"
+            early = sum(1 for status, _, worked in outcomes if status == 429 and not worked)
+            print(f"{'':<18} {early} of {statuses[429]} 429s answered before any recognizer call")
+            assert early == statuses[429], "an admitted request was rate limited half way through"
+
+        # circuit breaker: one process, the upstream goes down and comes back
+        client = stt_app.app.test_client()
+        upload = wav_bytes(synthetic_speech(60))
+        with override_config(
+            STT_RECOGNIZER=upstream_recognizer(base_url),
+            STT_CACHE=RecognitionCache(max_entries=0),
+            STT_RATE_LIMITER=None,
+            STT_CIRCUIT_BREAKER=CircuitBreaker(threshold=3, reset_timeout=1.0),
+            STT_RETRY_BACKOFF=0.05,
+        ):
+            upstream.reset()
+            upstream.down = True
+            first = client.post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+            calls = upstream.failed
+            t0 = time.perf_counter()
+            second = client.post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+            fail_fast = time.perf_counter() - t0
+            assert second.status_code == 503 and second.headers["Retry-After"], second.get_json()
+            assert upstream.failed == calls, "an open circuit still called the recognizer"
+            upstream.down = False
+            time.sleep(1.0)
+            third = client.post("/transcribe", data={"audio": (io.BytesIO(upload), "in.wav")})
+            assert third.status_code == 200, third.get_json()
+            print(f"upstream down: {first.status_code} after {calls} calls, then {second.status_code} in "
+                  f"{fail_fast * 1000:.0f} ms with no call (Retry-After {second.headers['Retry-After']}s); "
+                  f"back up: {third.status_code} after the reset timeout")
+
+            # client side: uploads arriving while the bucket is empty are turned away
+            bucket = stt_app.admission.TokenBucket(4, burst=4)
+            counters = stt_app.app.config["STT_METRICS"].registry.counters
+            key = ("stt_requests_total", (("endpoint", "transcribe"), ("status", "429")))
+            with override_config(
+                STT_RECOGNIZER=FakeRecognizer(0.01),
+                STT_RATE_LIMITER=bucket,
+                STT_RATE_MAX_WAIT=0.0,
+            ):
+                app_server, app_url = serve_app(stt_app.app)
+                chunks = [tone_chunk(i) for i in range(8)]
+                before = counters.get(key, 0)
+                try:
+                    for _ in range(int(bucket.burst)):
+                        bucket.reserve()  # another client just spent the burst
+                    t0 = time.perf_counter()
+                    with STTClient(f"{app_url}/transcribe", "kn-IN", max_in_flight=8, backoff=0.1) as stt:
+                        texts = stt.transcribe_chunks(chunks)
+                    wall = time.perf_counter() - t0
+                finally:
+                    app_server.shutdown()
+            assert all(texts), "a chunk was lost to rate limiting"
+            rejected = counters.get(key, 0) - before
+            assert rejected > 0, "no upload was answered 429 while the bucket was empty"
+            print(f"client: {len(chunks)} chunks at 4/s: {rejected:.0f} uploads answered 429 and retried "
+                  f"after Retry-After, the admitted ones queued for tokens; done in {wall:.2f}s")
+    finally:
+        server.shutdown()
+
+
+class StubSegmenter:
+    """
+    Stand-in for DeepSegment: segment() takes a text or a list of texts and
+    ends a sentence after a word when crc32(word) plus the word's position
+    in the window is a multiple of 5, so the result depends on where the
+    windows start. Words starting with "x" never end a sentence.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.windows = 0
+
+    def _split(self, text):
+        sentences, current = [], []
+        for position, word in enumerate(text.split()):
+            current.append(word)
+            if not word.startswith("x") and (zlib.crc32(word.encode()) + position) % 5 == 0:
+                sentences.append(" ".join(current))
+                current = []
+        if current:
+            sentences.append(" ".join(current))
+        return sentences
+
+    def segment(self, texts):
+        self.calls += 1
+        if isinstance(texts, str):
+            self.windows += 1
+            return self._split(texts)
+        self.windows += len(texts)
+        return [self._split(text) for text in texts]
+
+
+def upstream_segment_long(segmenter, text, n_window):
+    """DeepSegment.segment_long's loop for one text: one segment() call per window."""
+    words = text.split()
+    sentences, cut_off = [], []
+    while words:
+        window = n_window - len(cut_off)
+        if window < 1:
+            window = n_window
+        segmented = segmenter.segment(" ".join(cut_off + words[:window]))
+        words = words[window:]
+        sentences.extend(segmented[:-1])
+        cut_off = segmented[-1].split()
+    if cut_off:
+        sentences.append(" ".join(cut_off))
+    return sentences
+
+
+def check_punctuation(texts, n_window, seed=SEED):
+    import punctuation
+
+    rng = np.random.default_rng(seed)
+    words = transcript_words()
+    run = [f"x{i}" for i in range(n_window * 2 + 5)]  # no sentence end for over two windows
+    cases = ["", " ".join(words[:n_window - 1]), " ".join(words[:n_window]),
+             " ".join(words[:3] + run + words[3:20]), " ".join(run)]
+    for _ in range(texts - len(cases)):
+        start, length = rng.integers(len(words)), rng.integers(1, 8 * n_window)
+        text = [words[(start + i) % len(words)] for i in range(length)]
+        # some carried prefixes as long as a window, or longer
+        if rng.random() < 0.3:
+            at = rng.integers(len(text) + 1)
+            text[at:at] = run[:rng.integers(n_window, len(run) + 1)]
+        cases.append(" ".join(text))
+
+    sequential = StubSegmenter()
+    expected = [upstream_segment_long(sequential, text, n_window) for text in cases]
+    batched = StubSegmenter()
+    got = punctuation.segment_long_batch(batched, cases, n_window=n_window)
+    for i, (want, have) in enumerate(zip(expected, got)):
+        assert have == want, f"text {i}: {have} != {want}"
+    assert batched.windows == sequential.windows, "batching changed the windows"
+    longest = max(len(text.split()) for text in cases)
+    print(f"{len(cases)} texts (up to {longest} words, carried prefixes up to {len(run)} words, "
+          f"n_window {n_window}): same sentences as sequential segment_long; "
+          f"{sequential.calls} segment() calls -> {batched.calls}")
+
+    # through the shared batcher, from concurrent requests
+    old = punctuation._segmenter, punctuation._batcher
+    stub = StubSegmenter()
+    punctuation._segmenter, punctuation._batcher = stub, None
+    try:
+        results = [None] * len(cases)
+
+        def request(i):
+            results[i] = punctuation.segment_long(cases[i])
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(len(cases))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        punctuation._segmenter, punctuation._batcher = old
+    default = [upstream_segment_long(StubSegmenter(), text, punctuation.N_WINDOW) for text in cases]
+    assert results == default, "the batcher changed the sentences"
+    print(f"{len(cases)} concurrent segment_long() calls: same sentences, {stub.calls} segment() calls")
+
+
+def cache_worker(db_path, ttl, upload, results):
+    os.environ["STT_CACHE_DB"] = db_path
+    os.environ["STT_CACHE_TTL"] = str(ttl)
+    import app as stt_app
+
+    fake = FakeRecognizer(0.01, error_rate=0.2, vocab=transcript_words())
+    stt_app.app.config["STT_RECOGNIZER"] = fake
+    response = stt_app.app.test_client().post("/transcribe?lang=kn-IN", data={"audio": (io.BytesIO(upload), "in.wav")})
+    payload = response.get_json()
+    results.put((response.status_code, payload["cache"], payload["transcript"], fake.calls))
+
+
+def check_cache(seconds, ttl):
+    import multiprocessing
+
+    import app as stt_app
+    from cache import RecognitionCache
+
+    upload = wav_bytes(synthetic_speech(seconds))
+    ctx = multiprocessing.get_context("spawn")  # a fresh interpreter, like a restarted worker
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, "cache.db")
+        fake = FakeRecognizer(0.01, error_rate=0.2, vocab=transcript_words())
+        client = stt_app.app.test_client()
+
+        def post(lang="kn-IN"):
+            response = client.post(f"/transcribe?lang={lang}", data={"audio": (io.BytesIO(upload), "in.wav")})
+            assert response.status_code == 200, response.get_json()
+            return response.get_json()
+
+        def fresh_process():
+            results = ctx.Queue()
+            proc = ctx.Process(target=cache_worker, args=(db_path, ttl, upload, results))
+            proc.start()
+            outcome = results.get(timeout=60)
+            proc.join()
+            assert outcome[0] == 200, outcome
+            return outcome
+
+        with override_config(STT_RECOGNIZER=fake, STT_CACHE=RecognitionCache(ttl=ttl, db_path=db_path)):
+            first = post()
+            chunks = first["timing"]["chunks"]
+            assert fake.calls == chunks and first["cache"] == {"hits": 0, "misses": chunks}, first["cache"]
+
+            repeat = post()
+            assert fake.calls == chunks, f"{fake.calls - chunks} recognizer calls for a repeated upload"
+            assert repeat["cache"] == {"hits": chunks, "misses": 0}, repeat["cache"]
+            assert repeat["transcript"] == first["transcript"]
+            print(f"repeat upload: {chunks} chunks ({fake.unintelligible} unintelligible) "
+                  f"all answered from memory, 0 recognizer calls")
+
+            _, stats, transcript, calls = fresh_process()
+            assert calls == 0 and stats == {"hits": chunks, "misses": 0}, (calls, stats)
+            assert transcript == first["transcript"], "the SQLite tier changed the transcript"
+            print(f"fresh process: {stats['hits']} hits from the SQLite tier, 0 recognizer calls")
+
+            other = post("en-IN")
+            assert fake.calls == 2 * chunks and other["cache"] == {"hits": 0, "misses": chunks}, other["cache"]
+            print(f"other language: {chunks} misses, recognized again")
+
+            time.sleep(ttl + 0.2)
+            expired = post()
+            # a memory miss falls back to SQLite, so these misses mean both tiers expired
+            assert fake.calls == 3 * chunks and expired["cache"] == {"hits": 0, "misses": chunks}, expired["cache"]
+            print(f"after the {ttl:g}s TTL: {chunks} misses in memory and SQLite, recognized again")
+
+
+def jobs_claim_worker(jobs_dir, start, results):
+    from jobs import JobStore
+
+    store = JobStore(jobs_dir)
+    claimed = []
+    start.wait()  # all workers poll the queue at once
+    while True:
+        job = store.claim()
+        if job is None:
+            break
+        claimed.append(job["id"])
+    results.put(claimed)
+
+
+def check_jobs(jobs, workers):
+    import multiprocessing
+
+    import app as stt_app
+    from cache import RecognitionCache
+    from jobs import JobStore, process_job
+    from jobs import main as jobs_main
+
+    with tempfile.TemporaryDirectory() as scratch:
+        jobs_dir = os.path.join(scratch, "jobs")
+        store = JobStore(jobs_dir)
+        client = stt_app.app.test_client()
+        upload = wav_bytes(synthetic_speech(90))
+
+        def submit():
+            response = client.post("/jobs?lang=kn-IN", data={"audio": (io.BytesIO(upload), "in.wav")})
+            assert response.status_code == 202, response.get_json()
+            return response.get_json()
+
+        def status(job_id):
+            return client.get(f"/jobs/{job_id}").get_json()
+
+        with override_config(STT_RECOGNIZER=FakeRecognizer(0.01, vocab=transcript_words()),
+                             STT_CACHE=RecognitionCache(max_entries=0), STT_JOB_STORE=store):
+            # the whole round trip, one step at a time
+            direct = client.post("/transcribe?lang=kn-IN", data={"audio": (io.BytesIO(upload), "in.wav")}).get_json()
+            queued = submit()
+            assert queued["status"] == "queued" and status(queued["job_id"])["status"] == "queued"
+            job = store.claim()
+            assert job["id"] == queued["job_id"] and status(job["id"])["status"] == "running"
+            assert store.claim() is None, "a running job was claimed again"
+            process_job(store, job)
+            done = status(job["id"])
+            assert done["status"] == "done", done
+            progress = done["progress"]
+            assert progress["chunks_done"] == progress["chunks_total"] == direct["timing"]["chunks"], progress
+            assert done["result"]["transcript"] == direct["transcript"], "job and /transcribe disagree"
+            assert done["result"]["segments"] == direct["segments"]
+            assert not os.path.exists(job["audio_path"]), "the upload outlived its job"
+            assert client.get("/jobs/missing").status_code == 404
+            print(f"POST /jobs -> claim -> process_job -> GET /jobs/<id>: done, "
+                  f"{progress['chunks_done']}/{progress['chunks_total']} chunks, same transcript as /transcribe")
+
+            # the pool is stopped half way through a job; starting it again picks the job up
+            job_id = submit()["job_id"]
+            job = store.claim()
+            store.set_progress(job_id, 1, 3)
+            restarted = JobStore(jobs_dir)
+            assert restarted.requeue_running() == 1
+            after = status(job_id)
+            assert after["status"] == "queued" and after["progress"]["chunks_done"] == 0, after
+            job = restarted.claim()
+            assert job["id"] == job_id and os.path.exists(job["audio_path"])
+            process_job(restarted, job)
+            assert status(job_id)["status"] == "done"
+            assert restarted.requeue_running() == 0, "a finished job was re-queued"
+            print("restart: the interrupted job was re-queued once, claimed again and finished")
+
+            # the recognizer goes down mid-job: the breaker opens and the job waits in the queue
+            breaker = stt_app.admission.CircuitBreaker(threshold=1, reset_timeout=60)
+            with override_config(STT_RECOGNIZER=FakeRecognizer(0.01, fail_on=2, vocab=transcript_words()),
+                                 STT_CIRCUIT_BREAKER=breaker, STT_MAX_CONCURRENCY=1, STT_RETRY_BACKOFF=0.01):
+                job_id = submit()["job_id"]
+                job = store.claim()
+                process_job(store, job)
+                after = status(job_id)
+                assert after["status"] == "queued" and after["progress"]["chunks_done"] == 0, after
+                assert "error" not in after and os.path.exists(job["audio_path"]), after
+                breaker.success()  # the recognizer is back
+                job = store.claim()
+                assert job["id"] == job_id
+                process_job(store, job)
+                done = status(job_id)
+                assert done["status"] == "done", done
+                assert done["result"]["transcript"] == direct["transcript"]
+            print("circuit opened mid-job: the job went back to the queue, not failed, and finished later")
+
+        # a real worker process is killed half way through a job
+        kill_dir = os.path.join(scratch, "kill")
+        kill_store = JobStore(kill_dir)
+        ctx = multiprocessing.get_context("fork")  # jobs.main forks its workers, which keep this config
+        with override_config(STT_RECOGNIZER=FakeRecognizer(0.3, vocab=transcript_words()),
+                             STT_CACHE=RecognitionCache(max_entries=0), STT_MAX_CONCURRENCY=1):
+            supervisor = ctx.Process(target=jobs_main, args=(1, kill_dir))
+            supervisor.start()
+        try:
+            job_id = kill_store.submit(io.BytesIO(upload), "kn-IN", False)
+
+            def wait_for(predicate, timeout=30):
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    job = kill_store.get(job_id)
+                    if predicate(job):
+                        return job
+                    time.sleep(0.05)
+                raise AssertionError(f"job stuck: {kill_store.get(job_id)}")
+
+            wait_for(lambda job: job["status"] == "running" and job["progress"]["chunks_done"] >= 1)
+            with kill_store.db.connect() as conn:
+                (victim,) = conn.execute("SELECT worker FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            os.kill(victim, signal.SIGKILL)
+            t0 = time.monotonic()
+            done = wait_for(lambda job: job["status"] in ("done", "failed"))
+            assert done["status"] == "done", done
+            assert done["result"]["transcript"] == direct["transcript"], "the re-run disagrees with /transcribe"
+            with kill_store.db.connect() as conn:
+                (worker,) = conn.execute("SELECT worker FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            assert worker != victim, "the killed worker still owns the job"
+            print(f"worker {victim} killed mid-job: re-queued and finished by worker {worker} "
+                  f"{time.monotonic() - t0:.2f}s later")
+        finally:
+            supervisor.terminate()
+            supervisor.join()
+
+        # several worker processes polling one queue
+        race_dir = os.path.join(scratch, "race")
+        race = JobStore(race_dir)
+        submitted = {race.submit(io.BytesIO(b"x"), "kn-IN", False) for _ in range(jobs)}
+        ctx = multiprocessing.get_context("spawn")  # fresh interpreters, like jobs.py's workers
+        start, results = ctx.Event(), ctx.Queue()
+        procs = [ctx.Process(target=jobs_claim_worker, args=(race_dir, start, results)) for _ in range(workers)]
+        for proc in procs:
+            proc.start()
+        time.sleep(1.0)  # let every worker import and open the store
+        t0 = time.perf_counter()
+        start.set()
+        claimed = [results.get(timeout=60) for _ in procs]
+        wall = time.perf_counter() - t0
+        for proc in procs:
+            proc.join()
+        ids = [job_id for batch in claimed for job_id in batch]
+        duplicates = len(ids) - len(set(ids))
+        assert duplicates == 0, f"{duplicates} jobs claimed twice"
+        assert set(ids) == submitted, f"{len(submitted - set(ids))} jobs never claimed"
+        print(f"{workers} workers racing for {jobs} jobs: claimed {sorted(len(batch) for batch in claimed)} "
+              f"in {wall:.2f}s, none twice, none left")
+
+
+def peak_rss_mb():
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def suite_transcribe_case(seconds, latency, error_rate, workers, gaps):
+    """One /transcribe run of `seconds` of synthetic audio, in this (fresh) process."""
+    import hashlib
+
+    import app as stt_app
+    from cache import RecognitionCache
+
+    fake = FakeRecognizer(latency, error_rate=error_rate, vocab=transcript_words())
+    stt_app.app.config.update(
+        STT_RECOGNIZER=fake,
+        STT_CACHE=RecognitionCache(max_entries=0),
+        STT_MAX_CONCURRENCY=workers,
+        STT_REQUEST_DEADLINE=4 * 3600.0,
+    )
+    stream = SyntheticWavStream(seconds, SAMPLE_RATE, 1, gaps=gaps)
+    t0 = time.perf_counter()
+    status, payload = post_stream(stt_app.app, "/transcribe", stream, "audio/wav", stream.size)
+    wall = time.perf_counter() - t0
+    assert status == 200, payload
+
+    timing = payload["timing"]
+    stages = timing["stages"]
+    return {
+        "audio_s": timing["audio_s"],
+        "chunks": timing["chunks"],
+        "unintelligible": fake.unintelligible,
+        "transcript_sha1": hashlib.sha1(payload["transcript"].encode("utf-8")).hexdigest(),
+        "wall_s": round(wall, 3),
+        "stages": stages,
+        "chunks_per_s": round(timing["chunks"] / wall, 2),
+        # recognizer time per second of recognition wall time: ~workers when the pool is kept busy
+        "parallelism": round(stages.get("recognizer_calls", 0) / stages["recognize"], 2) if stages.get("recognize") else 0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def suite_merge_case(segments):
+    import hashlib
+
+    transcripts = synthetic_transcripts(segments)
+    t0 = time.perf_counter()
+    merged, _ = merge_segments((i, i + 1, t) for i, t in enumerate(transcripts))
+    wall = time.perf_counter() - t0
+    return {
+        "segments": segments,
+        "words": len(merged.split()),
+        "transcript_sha1": hashlib.sha1(merged.encode("utf-8")).hexdigest(),
+        "wall_s": round(wall, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_suite_case(args):
+    """Entry point of the per-case subprocess: prints the result as JSON."""
+    if args.case == "merge":
+        result = suite_merge_case(args.merge_segments)
+    else:
+        result = suite_transcribe_case(args.case_seconds, args.latency, args.error_rate, args.workers,
+                                       tuple(args.gaps))
+    print(json.dumps(result))
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Regression messages for results against a baseline (empty when all is well)."""
+    # absolute slack so millisecond-scale cases don't trip on scheduler noise
+    slack = {"wall_s": 0.25, "peak_rss_mb": 20.0}
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("chunks", "words", "transcript_sha1"):
+            if key in base and result.get(key) != base[key]:
+                problems.append(f"{name}: {key} changed from {base[key]} to {result.get(key)}")
+        for key, extra in slack.items():
+            limit = base[key] * (1 + tolerance) + extra
+            if result[key] > limit:
+                problems.append(f"{name}: {key} {result[key]} exceeds baseline {base[key]} (limit {limit:.2f})")
+        if base.get("parallelism") and result["parallelism"] < base["parallelism"] * (1 - tolerance):
+            problems.append(f"{name}: parallelism {result['parallelism']} fell from {base['parallelism']}")
+    return problems
+
+
+def run_suite(args):
+    settings = {
+        "seconds": args.seconds, "latency": args.latency, "error_rate": args.error_rate,
+        "workers": args.workers, "gaps": args.gaps, "merge_segments": args.merge_segments,
+    }
+    common = ["--latency", str(args.latency), "--error-rate", str(args.error_rate),
+              "--workers", str(args.workers), "--gaps", *map(str, args.gaps),
+              "--merge-segments", str(args.merge_segments)]
+    cases = [(f"transcribe_{seconds:g}s", ["--case", "transcribe", "--case-seconds", str(seconds)])
+             for seconds in args.seconds]
+    cases.append((f"merge_{args.merge_segments}", ["--case", "merge"]))
+
+    results = {}
+    for name, case_args in cases:
+        # a fresh interpreter per case, so peak RSS belongs to that case alone
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "suite-case", *case_args, *common],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise SystemExit(f"{name} failed:\n{proc.stderr}")
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        r = results[name]
+        line = f"{name:<20} wall {r['wall_s']:8.2f}s  peak RSS {r['peak_rss_mb']:7.1f} MB"
+        if "chunks" in r:
+            stages = " ".join(f"{k}={v:.2f}" for k, v in r["stages"].items())
+            line += (f"  {r['chunks']:4d} chunks ({r['chunks_per_s']:.1f}/s, {r['unintelligible']} unintelligible)"
+                     f"  parallelism {r['parallelism']:.1f}  [{stages}]")
+        else:
+            line += f"  {r['segments']} segments -> {r['words']} words"
+        print(line)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["settings"] != settings:
+        raise SystemExit(f"{args.baseline} was recorded with different settings: {baseline['settings']}")
+    problems = compare_to_baseline(results, baseline["results"], args.tolerance)
+    if problems:
+        print("\nREGRESSIONS against " + args.baseline + ":")
+        for problem in problems:
+            print(f"  - {problem}")
+        raise SystemExit(1)
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p_vad = sub.add_parser("vad", help="VAD parity with pydub and timing")
+    p_vad.add_argument("--seconds", type=float, default=120)
+    p_rec = sub.add_parser("recognize", help="concurrent recognition with a fake recognizer")
+    p_rec.add_argument("--chunks", type=int, default=20)
+    p_rec.add_argument("--latency", type=float, default=0.2)
+    p_rec.add_argument("--workers", type=int, default=4)
+    p_tmp = sub.add_parser("tempfiles", help="check /transcribe never touches the temp dir")
+    p_tmp.add_argument("--seconds", type=float, default=60)
+    p_merge = sub.add_parser("merge", help="transcript merging on very long synthetic transcripts")
+    p_merge.add_argument("--segments", type=int, default=3000)
+    p_plan = sub.add_parser("plan", help="chunk packing with many tiny pieces")
+    p_plan.add_argument("--pieces", type=int, default=5000)
+    sub.add_parser("startup", help="worker import time and RSS with/without the punctuation model")
+    p_ingest = sub.add_parser("ingest", help="streaming decode parity and memory on a long recording")
+    p_ingest.add_argument("--minutes", type=float, default=120)
+    p_client = sub.add_parser("client", help="pooled, pipelined client against a local server")
+    p_client.add_argument("--chunks", type=int, default=30)
+    p_client.add_argument("--latency", type=float, default=0.2)
+    p_client.add_argument("--in-flight", type=int, default=30)
+    p_stream = sub.add_parser("stream", help="/transcribe/stream event timing, payload and errors")
+    p_stream.add_argument("--seconds", type=float, default=50)
+    p_stream.add_argument("--latency", type=float, default=0.3)
+    p_live = sub.add_parser("live", help="live streaming latency with a replayed recording")
+    p_live.add_argument("--seconds", type=float, default=30)
+    p_live.add_argument("--latency", type=float, default=0.3)
+    p_metrics = sub.add_parser("metrics", help="/metrics aggregation across worker processes and profiling")
+    p_metrics.add_argument("--workers", type=int, default=3)
+    p_metrics.add_argument("--requests", type=int, default=4)
+    p_adm = sub.add_parser("admission", help="shared recognizer rate limit, circuit breaker and client retries")
+    p_adm.add_argument("--workers", type=int, default=3)
+    p_adm.add_argument("--requests", type=int, default=6)
+    p_adm.add_argument("--quota", type=float, default=6)
+    p_adm.add_argument("--latency", type=float, default=0.1)
+    p_punct = sub.add_parser("punctuation", help="batched segmentation against sequential segment_long")
+    p_punct.add_argument("--texts", type=int, default=200)
+    p_punct.add_argument("--window", type=int, default=10)
+    p_cache = sub.add_parser("cache", help="recognition cache hits, SQLite tier, language and TTL")
+    p_cache.add_argument("--seconds", type=float, default=120)
+    p_cache.add_argument("--ttl", type=float, default=2)
+    p_jobs = sub.add_parser("jobs", help="job queue round trip, restart and concurrent claims")
+    p_jobs.add_argument("--jobs", type=int, default=200)
+    p_jobs.add_argument("--workers", type=int, default=4)
+    for name, help_text in (("suite", "regression suite against a JSON baseline"),
+                            ("suite-case", "one suite case (run by suite in a fresh process)")):
+        p_suite = sub.add_parser(name, help=help_text)
+        p_suite.add_argument("--latency", type=float, default=0.05)
+        p_suite.add_argument("--error-rate", type=float, default=0.05)
+        p_suite.add_argument("--workers", type=int, default=4)
+        p_suite.add_argument("--gaps", type=float, nargs=2, default=[0.1, 2.0], metavar=("MIN", "MAX"))
+        p_suite.add_argument("--merge-segments", type=int, default=3000)
+    p_suite.add_argument("--case", choices=("transcribe", "merge"), required=True)
+    p_suite.add_argument("--case-seconds", type=float, default=60)
+    p_suite = sub.choices["suite"]
+    p_suite.add_argument("--seconds", type=float, nargs="+", default=[10, 60, 600, 7200])
+    p_suite.add_argument("--baseline", default="benchmark_baseline.json")
+    p_suite.add_argument("--update-baseline", action="store_true")
+    p_suite.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.bench == "vad":
+        bench_vad(args.seconds)
+    elif args.bench == "recognize":
+        bench_recognize(args.chunks, args.latency, args.workers)
+    elif args.bench == "tempfiles":
+        check_tempfiles(args.seconds)
+    elif args.bench == "merge":
+        bench_merge(args.segments)
+    elif args.bench == "plan":
+        bench_plan(args.pieces)
+    elif args.bench == "startup":
+        bench_startup()
+    elif args.bench == "ingest":
+        bench_ingest(args.minutes)
+    elif args.bench == "client":
+        bench_client(args.chunks, args.latency, args.in_flight)
+    elif args.bench == "stream":
+        check_stream(args.seconds, args.latency)
+    elif args.bench == "live":
+        bench_live(args.seconds, args.latency)
+    elif args.bench == "metrics":
+        check_metrics(args.workers, args.requests)
+    elif args.bench == "admission":
+        check_admission(args.workers, args.requests, args.quota, args.latency)
+    elif args.bench == "punctuation":
+        check_punctuation(args.texts, args.window)
+    elif args.bench == "cache":
+        check_cache(args.seconds, args.ttl)
+    elif args.bench == "jobs":
+        check_jobs(args.jobs, args.workers)
+    elif args.bench == "suite":
+        run_suite(args)
+    elif args.bench == "suite-case":
+        run_suite_case(args)
@@ -0,0 +1,180 @@
+# cache.py
+"""
+Content-addressed cache in front of the recognizer.
+
+Chunks are keyed by a SHA-256 of their normalized PCM (16 kHz mono int16,
+as produced by audio_io) plus the language code, so a retried upload or a
+re-posted chunk is answered without a network round trip.
+
+Two tiers:
+  - an in-process LRU with a maximum entry count and a TTL
+  - an optional SQLite file shared by every gunicorn worker on the host
+
+"Unintelligible" results are cached too and replayed as sr.UnknownValueError;
+RequestErrors are never cached.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import speech_recognition as sr
+
+from shared_db import SharedDB
+
+_UNKNOWN = object()  # cached sr.UnknownValueError
+
+
+def cache_key(audio_data, language):
+    h = hashlib.sha256()
+    h.update(f"{language}|{audio_data.sample_rate}|{audio_data.sample_width}|".encode())
+    h.update(audio_data.frame_data)
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with a maximum number of entries and a TTL in seconds."""
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk tier shared between processes (see shared_db), so a cache built
+    in a preloading gunicorn master is safe to use after the fork.
+    """
+
+    def __init__(self, path, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.db = SharedDB(
+            path,
+            "CREATE TABLE IF NOT EXISTS recognitions ("
+            " key TEXT PRIMARY KEY, text TEXT, unknown INTEGER NOT NULL, created REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS recognitions_created ON recognitions (created)",
+        )
+
+    def get(self, key):
+        row = self.db.connect().execute(
+            "SELECT text, unknown FROM recognitions WHERE key = ? AND created >= ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        return _UNKNOWN if row[1] else row[0]
+
+    def put(self, key, value):
+        unknown = value is _UNKNOWN
+        now = time.time()
+        with self.db.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recognitions (key, text, unknown, created) VALUES (?, ?, ?, ?)",
+                (key, None if unknown else value, int(unknown), now),
+            )
+            conn.execute("DELETE FROM recognitions WHERE created < ?", (now - self.ttl,))
+
+
+class RecognitionCache:
+    """Memory LRU backed by an optional SQLite file, with process-wide hit/miss counters."""
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, db_path=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = SQLiteCache(db_path, ttl) if db_path else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"[⚠️ Cache read error]: {e}")
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except sqlite3.Error as e:
+                print(f"[⚠️ Cache write error]: {e}")
+
+    def wrap(self, recognize):
+        return CachedRecognizer(self, recognize)
+
+
+class CachedRecognizer:
+    """
+    Recognizer callable that consults the cache first. Counts the hits and
+    misses of its own calls, so one instance per request gives request stats.
+    """
+
+    def __init__(self, cache, recognize):
+        self.cache = cache
+        self.recognize = recognize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, audio_data, language="en-US"):
+        key = cache_key(audio_data, language)
+        value = self.cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if value is None:
+            try:
+                value = self.recognize(audio_data, language=language)
+            except sr.UnknownValueError:
+                self.cache.put(key, _UNKNOWN)
+                raise
+            self.cache.put(key, value)
+
+        if value is _UNKNOWN:
+            raise sr.UnknownValueError()
+        return value
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,50 @@
+# chunking.py
+"""
+Chunk planning on millisecond offsets.
+
+Silence-split pieces are packed into recognition chunks without touching any
+audio: the planner only works with [start_ms, end_ms] ranges into the source
+recording, and callers materialize each chunk once by slicing the source.
+"""
+
+MAX_CHUNK_MS = 30000  # 30 seconds
+OVERLAP_MS = 500      # 0.5s overlap
+MIN_PIECE_MS = 800    # skip extremely tiny noises
+
+
+def plan_chunks(ranges, total_ms, max_chunk_ms=MAX_CHUNK_MS, overlap_ms=OVERLAP_MS,
+                min_piece_ms=MIN_PIECE_MS, fallback=True):
+    """
+    Pack consecutive silence-split ranges into chunks of at most max_chunk_ms.
+
+    Each chunk is a contiguous span from its first piece's start to its last
+    piece's end, extended by overlap_ms into the following audio to reduce
+    word-cut risk. Pieces shorter than min_piece_ms are skipped; a single
+    piece longer than max_chunk_ms becomes its own chunk. If nothing
+    qualifies, the whole recording is returned as one chunk (or nothing,
+    with fallback=False).
+
+    Returns a list of (start_ms, end_ms) tuples in time order. Linear in the
+    number of ranges.
+    """
+    spans = []
+    cur_start = cur_end = None
+
+    for start, end in ranges:
+        if end - start < min_piece_ms:
+            continue
+
+        if cur_start is not None and end - cur_start <= max_chunk_ms:
+            cur_end = end
+        else:
+            if cur_start is not None and cur_end - cur_start > min_piece_ms:
+                spans.append((cur_start, cur_end))
+            cur_start, cur_end = start, end
+
+    if cur_start is not None and cur_end - cur_start > min_piece_ms:
+        spans.append((cur_start, cur_end))
+
+    if not spans:
+        return [(0, total_ms)] if fallback else []
+
+    return [(start, min(end + overlap_ms, total_ms)) for start, end in spans]
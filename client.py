@@ -0,0 +1,220 @@
+# client.py
+"""
+Client for the /transcribe API.
+
+Every upload goes through one requests.Session, so connections (and TLS
+sessions) are pooled and kept alive instead of being opened per chunk.
+Chunks are encoded to FLAC in memory (about half the bytes of WAV for
+speech) and up to max_in_flight of them are uploaded at once, so encoding,
+upload and server-side recognition overlap; results are collected in chunk
+order. 5xx and 429 responses and connection errors are retried with
+jittered exponential backoff, waiting at least as long as the server's
+Retry-After asks.
+
+    with STTClient(language="kn-IN") as client:
+        texts = client.transcribe_chunks(chunks)  # int16 16 kHz arrays
+
+Live mode (stream_live) sends raw PCM to /transcribe/live as it is captured
+and reads the recognized segments back on the same connection.
+"""
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import requests
+import speech_recognition as sr
+from requests.adapters import HTTPAdapter
+
+SERVER_URL = "https://kannada-stt.onrender.com/transcribe"
+SAMPLE_RATE = 16000
+
+
+class TranscriptionError(Exception):
+    """A chunk could not be transcribed (client error, or retries exhausted)."""
+
+
+def replay_frames(samples, frame_ms=100, realtime=True):
+    """
+    Fake microphone: yield int16 samples in frame_ms frames, paced like live
+    capture when realtime is set, so a recording can drive stream_live.
+    """
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    started = time.monotonic()
+    for i, pos in enumerate(range(0, len(samples), frame_len)):
+        if realtime:
+            time.sleep(max(0.0, started + (i + 1) * frame_ms / 1000 - time.monotonic()))
+        yield samples[pos:pos + frame_len]
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header (0 when missing or given as a date)."""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except ValueError:
+        return 0.0
+
+
+def encode_flac(samples, sample_rate=SAMPLE_RATE):
+    """Encode mono int16 samples as FLAC bytes, without touching the disk."""
+    pcm = np.ascontiguousarray(samples, dtype=np.int16).tobytes()
+    # SpeechRecognition ships a flac encoder and runs it over pipes
+    return sr.AudioData(pcm, sample_rate, 2).get_flac_data()
+
+
+class STTClient:
+    """
+    Pooled, pipelined uploads to one /transcribe endpoint.
+
+    max_in_flight bounds both the worker threads and the connection pool.
+    Set it to what the server can recognize concurrently: more uploads than
+    that only queue up on the server.
+    """
+
+    def __init__(self, server_url=SERVER_URL, language="kn-IN", punctuate=None,
+                 max_in_flight=4, retries=3, backoff=0.5, timeout=120, session=None):
+        self.server_url = server_url
+        self.language = language
+        # punctuation is only available for English
+        self.punctuate = language.startswith("en") if punctuate is None else punctuate
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _params(self):
+        params = {"lang": self.language}
+        if self.punctuate:
+            params["punctuate"] = "1"
+        return params
+
+    def transcribe(self, audio_bytes, filename="audio.flac", content_type="audio/flac"):
+        """Upload one encoded recording and return the server's JSON payload."""
+        params = self._params()
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(
+                    self.server_url,
+                    params=params,
+                    files={"audio": (filename, audio_bytes, content_type)},
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise TranscriptionError(f"request failed: {e}") from e
+                delay = 0.0
+            else:
+                if response.ok:
+                    return response.json()
+                if (response.status_code < 500 and response.status_code != 429) or last:
+                    raise TranscriptionError(f"server error [{response.status_code}]: {response.text}")
+                delay = retry_after(response)
+            # jitter keeps parallel uploads from retrying in lockstep
+            time.sleep(max(delay, random.uniform(0, self.backoff * 2 ** attempt)))
+
+    def transcribe_chunk(self, samples, sample_rate=SAMPLE_RATE):
+        """Transcribe one chunk of int16 samples; returns the (punctuated) text."""
+        result = self.transcribe(encode_flac(samples, sample_rate))
+        return (result.get("punctuated") or result.get("transcript", "")).strip()
+
+    def transcribe_chunks(self, chunks, sample_rate=SAMPLE_RATE, on_result=None):
+        """
+        Transcribe chunks with up to max_in_flight uploads at a time.
+
+        Returns the texts in chunk order; a chunk that fails is reported and
+        comes back as "". on_result(index, text) is called as each chunk
+        finishes, in completion order.
+        """
+        def work(index, chunk):
+            try:
+                text = self.transcribe_chunk(chunk, sample_rate)
+            except TranscriptionError as e:
+                print(f"❌ Error transcribing chunk {index + 1}: {e}")
+                text = ""
+            if on_result is not None:
+                on_result(index, text)
+            return text
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            futures = [executor.submit(work, i, chunk) for i, chunk in enumerate(chunks)]
+            return [f.result() for f in futures]
+
+    def stream_live(self, frames, on_segment=None):
+        """
+        Live transcription: send frames (int16 16 kHz mono arrays, e.g. from
+        a microphone callback) to /transcribe/live as a chunked upload while
+        reading results back on the same connection.
+
+        on_segment(event) is called with each {"index", "start_ms", "end_ms",
+        "text"} as soon as the server recognizes it. Returns the final
+        /transcribe payload once frames is exhausted.
+        """
+        url = urlsplit(self.server_url.rstrip("/") + "/live")
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = connection_class(url.netloc, timeout=self.timeout)
+        response = None
+        try:
+            conn.putrequest("POST", f"{url.path}?{urlencode(self._params())}")
+            conn.putheader("Content-Type", f"audio/L16; rate={SAMPLE_RATE}")
+            conn.putheader("Transfer-Encoding", "chunked")
+            conn.endheaders()
+            # write to the socket directly: once the response starts, http.client
+            # hands the connection to it and would open a new one on send()
+            sock = conn.sock
+
+            def send():
+                try:
+                    for frame in frames:
+                        data = np.ascontiguousarray(frame, dtype=np.int16).tobytes()
+                        if data:
+                            sock.sendall(b"%x\r\n%s\r\n" % (len(data), data))
+                    sock.sendall(b"0\r\n\r\n")
+                except OSError:
+                    pass  # the server closed the connection; the response says why
+
+            # upload and results share the connection, one direction per thread
+            sender = threading.Thread(target=send, name="live-upload", daemon=True)
+            sender.start()
+            response = conn.getresponse()
+            if response.status != 200:
+                body = response.read().decode(errors="replace")
+                raise TranscriptionError(f"server error [{response.status}]: {body}")
+
+            event = None
+            for line in response:
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "segment" and on_segment is not None:
+                        on_segment(data)
+                    elif event == "done":
+                        return data
+                    elif event == "error":
+                        raise TranscriptionError(data.get("error", "live transcription failed"))
+            raise TranscriptionError("connection closed before the transcript was complete")
+        finally:
+            if response is not None:
+                response.close()
+            conn.close()
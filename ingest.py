@@ -0,0 +1,425 @@
+# ingest.py
+"""
+Bounded-memory streaming ingest.
+
+The upload is read off the request as it arrives (a multipart/form-data
+field through MultipartFile, or the raw body) and decoded block by block
+into 16 kHz mono int16 PCM:
+  - WAV is read directly with the wave module; every block is downmixed,
+    resampled and converted with the same audioop calls pydub used
+    (tomono -> ratecv -> lin2lin), carrying the resampler state across
+    blocks, so the samples are identical to decoding the whole file at once
+  - FLAC is decoded to WAV by the flac binary SpeechRecognition ships with
+    and then read the same way
+  - anything else (OGG, MP3, float or extensible WAV, ...) is piped through
+    ffmpeg, which writes the same PCM format to stdout
+
+ChunkStream feeds those blocks to the silence segmenter one analysis window
+at a time and hands out finished chunks as soon as they are planned, so peak
+memory is bounded by the window and the chunks in flight rather than by the
+length of the recording.
+"""
+import audioop
+import os
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+import speech_recognition as sr
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+import audio_io
+import vad
+from chunking import plan_chunks
+
+SAMPLE_RATE = audio_io.SAMPLE_RATE
+BLOCK_SECONDS = 1.0  # decode granularity
+# audio analysed together; uploads shorter than this segment exactly like a
+# whole-file pass (the silence threshold is relative to the loudness seen so far)
+WINDOW_SECONDS = float(os.environ.get("STT_INGEST_WINDOW", "300"))
+# first window when the first chunk is wanted early (/transcribe/stream): at
+# least two chunks long, so one can be handed out before the window is full
+FIRST_WINDOW_SECONDS = float(os.environ.get("STT_STREAM_FIRST_WINDOW", "60"))
+MAX_AUDIO_SECONDS = float(os.environ.get("STT_MAX_AUDIO_SECONDS", str(3 * 3600)))
+
+
+class AudioTooLong(Exception):
+    """The upload is longer than the configured maximum duration."""
+
+
+class InvalidUpload(ValueError):
+    """The upload body is malformed, e.g. form data cut off before its end."""
+
+
+class _Prefixed:
+    """
+    Reader returning `prefix` before the rest of `stream`. read(n) always
+    returns n bytes unless the input is exhausted. With record=True every
+    byte handed out is kept, so the input can be replayed (see replay()).
+    """
+
+    def __init__(self, prefix, stream, record=False):
+        self._prefix = prefix
+        self._stream = stream
+        self._recorded = bytearray() if record else None
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            data = self._prefix + self._stream.read()
+            self._prefix = b""
+        else:
+            data = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            while len(data) < n:
+                more = self._stream.read(n - len(data))
+                if not more:
+                    break
+                data += more
+        if self._recorded is not None:
+            self._recorded += data
+        return data
+
+    def stop_recording(self):
+        self._recorded = None
+
+    def replay(self):
+        """A fresh reader over everything read so far followed by the rest."""
+        return _Prefixed(bytes(self._recorded) + self._prefix, self._stream)
+
+
+class MultipartFile:
+    """
+    One file field of a multipart/form-data body, read incrementally off the
+    request stream. request.files would parse (and hold) the whole body
+    before the first byte could be decoded; this hands the file's bytes to
+    the decoder as they arrive and skips the other fields.
+    """
+
+    def __init__(self, stream, boundary, field):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"))
+        self._field = field
+        self._pending = bytearray()
+        self._done = False
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            self._decoder.receive_data(self._stream.read(1 << 16) or None)
+
+    def open(self):
+        """Skip to the start of the field's file (dropping other fields); False if the body has none."""
+        while True:
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                return False
+            if isinstance(event, File) and event.name == self._field:
+                return True
+
+    def read(self, n=-1):
+        while not self._done and (n is None or n < 0 or len(self._pending) < n):
+            try:
+                event = self._next_event()
+            except ValueError as e:
+                # the body ended (or broke) before the form data was complete
+                raise InvalidUpload(f"malformed form data: {e}")
+            if isinstance(event, Data):
+                self._pending += event.data
+                self._done = not event.more_data
+            else:
+                self._done = True
+        if n is None or n < 0:
+            n = len(self._pending)
+        data = bytes(self._pending[:n])
+        del self._pending[:n]
+        return data
+
+
+def _wav_blocks(wav, max_seconds):
+    channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+    if wav.getnframes() / rate > max_seconds:
+        raise AudioTooLong(f"audio is {wav.getnframes() / rate:.0f}s long, the limit is {max_seconds:.0f}s")
+
+    block_frames = int(rate * BLOCK_SECONDS)
+    frame_size = channels * width
+    state = None
+    rest = b""
+    while True:
+        data = wav.readframes(block_frames)
+        if not data:
+            break
+        data = rest + data
+        cut = len(data) - len(data) % frame_size
+        data, rest = data[:cut], data[cut:]
+
+        if width == 1:
+            # 8-bit WAV is unsigned
+            data = audioop.bias(data, 1, -128)
+        if channels == 2:
+            data = audioop.tomono(data, width, 0.5, 0.5)
+        elif channels > 2:
+            dtype = {1: np.int8, 2: np.int16, 4: np.int32}.get(width)
+            if dtype is None:
+                data = audioop.lin2lin(data, width, 4)
+                width, dtype = 4, np.int32
+            frames = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+            data = frames.mean(axis=1).astype(dtype).tobytes()
+        if rate != SAMPLE_RATE:
+            data, state = audioop.ratecv(data, width, 1, rate, SAMPLE_RATE, state)
+        if width != 2:
+            data = audioop.lin2lin(data, width, 2)
+        yield np.frombuffer(data, dtype=np.int16)
+
+
+def _piped_blocks(cmd, reader, read_blocks):
+    """
+    Run a decoder reading the upload on stdin; read_blocks(stdout) yields
+    the PCM blocks it writes out.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    upload_error = []
+
+    def feed():
+        try:
+            while True:
+                block = reader.read(1 << 16)
+                if not block:
+                    break
+                proc.stdin.write(block)
+        except InvalidUpload as e:
+            upload_error.append(e)
+        except (BrokenPipeError, OSError, ValueError):
+            pass  # the decoder exited early; its exit status reports why
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="decoder-feed", daemon=True)
+    feeder.start()
+    try:
+        try:
+            yield from read_blocks(proc.stdout)
+            failed = proc.wait() != 0
+        except (wave.Error, EOFError):
+            # the decoder's output ended early or is not valid WAV
+            proc.wait()
+            failed = True
+        feeder.join(timeout=1)
+        if upload_error:
+            # whatever the decoder made of it, the upload itself was broken
+            raise upload_error[0]
+        if failed:
+            error = proc.stderr.read().decode(errors="replace").strip()
+            raise ValueError(f"Could not decode audio: {error or os.path.basename(cmd[0]) + ' failed'}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        feeder.join(timeout=1)
+
+
+def _raw_blocks(out):
+    block_bytes = int(SAMPLE_RATE * BLOCK_SECONDS) * 2
+    rest = b""
+    while True:
+        data = out.read(block_bytes)
+        if not data:
+            break
+        data = rest + data
+        cut = len(data) - len(data) % 2
+        data, rest = data[:cut], data[cut:]
+        yield np.frombuffer(data, dtype=np.int16)
+
+
+def _ffmpeg_blocks(reader):
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+           "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    return _piped_blocks(cmd, reader, _raw_blocks)
+
+
+def _flac_blocks(reader, max_seconds):
+    # the flac binary bundled with SpeechRecognition decodes to WAV, so FLAC
+    # uploads (what client.py sends) work even without ffmpeg installed
+    cmd = [sr.get_flac_converter(), "--decode", "--stdout", "--silent", "-"]
+    return _piped_blocks(cmd, reader, lambda out: _wav_blocks(wave.open(out), max_seconds))
+
+
+def iter_pcm(stream, max_seconds=MAX_AUDIO_SECONDS):
+    """Yield the upload as 16 kHz mono int16 blocks of about BLOCK_SECONDS."""
+    head = stream.read(12)
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        reader = _Prefixed(head, stream, record=True)
+        try:
+            wav = wave.open(reader)
+        except (wave.Error, EOFError):
+            # float / extensible WAV: let ffmpeg handle it
+            yield from _ffmpeg_blocks(reader.replay())
+            return
+        reader.stop_recording()
+        yield from _wav_blocks(wav, max_seconds)
+    elif head[:4] == b"fLaC":
+        yield from _flac_blocks(_Prefixed(head, stream), max_seconds)
+    else:
+        yield from _ffmpeg_blocks(_Prefixed(head, stream))
+
+
+class ChunkStream:
+    """
+    Recognition chunks of an upload, produced while it is being decoded.
+
+    Iterating yields sr.AudioData chunks in time order; self.spans[i] holds
+    the (start_ms, end_ms) of the i-th chunk once it has been yielded. Audio
+    is decoded until an analysis window is full, then split on silence and
+    planned exactly like a whole recording. Chunks are copied out of the
+    window (once each) and everything before the last, still-growing chunk
+    is released. The first window is analysed on construction so
+    noise_floor is available before recognition starts.
+
+    With first_window_seconds, the first window is that short instead and
+    each next one twice as long, up to window_seconds, so the first chunk is
+    out after that much audio rather than a whole window. The trade-off: the
+    silence threshold of the early windows comes from the loudness of less
+    audio, so chunk edges of a recording longer than the first window can
+    differ slightly from a pass with full windows.
+
+    timings accumulates the seconds spent per stage: "decode" (reading and
+    decoding the upload), "segment" (silence detection), "plan" (chunk
+    packing) and "slice" (copying chunks out of the window).
+    """
+
+    def __init__(self, stream, window_seconds=WINDOW_SECONDS, max_seconds=MAX_AUDIO_SECONDS,
+                 min_silence_len=800, silence_offset_db=14, keep_silence=400,
+                 max_chunk_ms=30000, overlap_ms=500, first_window_seconds=None):
+        self.spans = []
+        self.noise_floor = 0.0
+        self.decoded_ms = 0
+        self.timings = {"decode": 0.0, "segment": 0.0, "plan": 0.0, "slice": 0.0}
+
+        self._blocks = iter_pcm(stream, max_seconds)
+        self._window_frames = int(window_seconds * SAMPLE_RATE)
+        # size of the window being read; grows to _window_frames
+        self._next_window_frames = int(min(first_window_seconds or window_seconds, window_seconds) * SAMPLE_RATE)
+        self._max_seconds = max_seconds
+        self._min_silence_len = min_silence_len
+        self._silence_offset_db = silence_offset_db
+        self._keep_silence = keep_silence
+        self._max_chunk_ms = max_chunk_ms
+        self._overlap_ms = overlap_ms
+
+        self._buffer = np.zeros(0, dtype=np.int16)
+        self._buffer_start_ms = 0
+        self._decoded_frames = 0
+        self._sum_squares = 0
+        self._ready = deque()
+        self._eof = False
+        self._analysed = False
+
+        self._advance()
+
+    def __iter__(self):
+        while True:
+            while not self._ready and not self._eof:
+                self._advance()
+            if not self._ready:
+                return
+            start, end, samples = self._ready.popleft()
+            self.spans.append((start, end))
+            yield audio_io.to_audio_data(samples)
+
+    def _timed(self, stage, started):
+        now = time.perf_counter()
+        self.timings[stage] += now - started
+        return now
+
+    def _read_window(self):
+        """Decode until the buffer holds a full window (or the input ends)."""
+        started = time.perf_counter()
+        try:
+            return self._decode_window()
+        finally:
+            self._timed("decode", started)
+
+    def _decode_window(self):
+        blocks = [self._buffer]
+        frames = len(self._buffer)
+        for block in self._blocks:
+            blocks.append(block)
+            frames += len(block)
+            self._decoded_frames += len(block)
+            self._sum_squares += int(np.square(block, dtype=np.int64).sum())
+            self.decoded_ms = self._decoded_frames * 1000 // SAMPLE_RATE
+            if self.decoded_ms > self._max_seconds * 1000:
+                raise AudioTooLong(f"audio is longer than the {self._max_seconds:.0f}s limit")
+            if frames >= self._next_window_frames:
+                break
+        else:
+            self._eof = True
+        self._next_window_frames = min(self._next_window_frames * 2, self._window_frames)
+        return np.concatenate(blocks)
+
+    def _loudness_dbfs(self):
+        """dBFS of everything decoded so far, like AudioSegment.dBFS of the whole file."""
+        if not self._decoded_frames:
+            return -float("inf")
+        rms = int(np.sqrt(self._sum_squares / self._decoded_frames))
+        if not rms:
+            return -float("inf")
+        return 20 * np.log10(rms / 32768)
+
+    def _advance(self):
+        buf = self._read_window()
+        t = time.perf_counter()
+        total_ms = vad.duration_ms(buf, SAMPLE_RATE)
+        silence_thresh = self._loudness_dbfs() - self._silence_offset_db
+        rms = vad.window_rms(buf, SAMPLE_RATE, self._min_silence_len)
+        ranges = vad.split_on_silence(
+            buf, SAMPLE_RATE, self._min_silence_len, silence_thresh, self._keep_silence, rms
+        )
+        if not self._analysed:
+            self.noise_floor = vad.noise_floor(buf, SAMPLE_RATE, self._min_silence_len, silence_thresh, rms)
+            self._analysed = True
+        t = self._timed("segment", t)
+
+        if self._eof:
+            # everything left is final; only fall back to one whole chunk if
+            # the recording produced no chunks at all
+            spans = plan_chunks(ranges, total_ms, self._max_chunk_ms, self._overlap_ms,
+                                fallback=not self.spans and not self._ready)
+            commit, keep_from = spans, total_ms
+        else:
+            # a piece running into the end of the window may still continue
+            provisional = ranges[-1][0] if ranges and ranges[-1][1] >= total_ms else None
+            final_ranges = ranges[:-1] if provisional is not None else ranges
+            spans = plan_chunks(final_ranges, total_ms, self._max_chunk_ms, self._overlap_ms, fallback=False)
+            # where the next, not yet final piece can start
+            next_from = provisional if provisional is not None else max(total_ms - self._keep_silence, 0)
+            # the last chunk may still absorb the next pieces, unless they could
+            # no longer fit in it; its overlap must not be cut off at the window end
+            if spans and (total_ms - spans[-1][0] <= self._max_chunk_ms or spans[-1][1] >= total_ms):
+                commit, keep_from = spans[:-1], spans[-1][0]
+            else:
+                commit, keep_from = spans, next_from
+
+            if provisional == 0:
+                # no usable silence in a whole window: cut hard at max_chunk_ms
+                cuts = range(0, total_ms - self._max_chunk_ms + 1, self._max_chunk_ms)
+                commit = [(start, start + self._max_chunk_ms) for start in cuts]
+                keep_from = commit[-1][1] if commit else 0
+
+        t = self._timed("plan", t)
+
+        base = self._buffer_start_ms
+        for start, end in commit:
+            chunk = audio_io.slice_ms(buf, start, end).copy()
+            self._ready.append((base + start, base + end, chunk))
+
+        self._buffer = audio_io.slice_ms(buf, keep_from, total_ms).copy()
+        self._buffer_start_ms = base + keep_from
+        self._timed("slice", t)
@@ -0,0 +1,302 @@
+# jobs.py
+"""
+Asynchronous transcription jobs.
+
+POST /jobs stores the upload and a queued row in a local SQLite database and
+returns immediately; a separate pool of worker processes runs the usual
+chunk/recognize/merge pipeline and records progress and the result, which
+GET /jobs/<id> reports. Jobs and their audio live on disk, so queued work
+survives a restart; jobs that were running when the workers stopped are
+re-queued when they start again, and the job of a worker that dies is
+re-queued when the supervisor replaces it.
+
+Run the workers next to gunicorn:
+
+    python jobs.py --processes 2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+
+from shared_db import SharedDB
+
+JOBS_DIR = os.environ.get("STT_JOBS_DIR", "jobs")
+# recordings handled here are long; the HTTP deadline does not apply
+JOB_DEADLINE = float(os.environ.get("STT_JOB_DEADLINE", "3600"))
+POLL_INTERVAL = 0.5  # seconds between queue checks when idle
+
+
+class JobStore:
+    """SQLite-backed job table plus a directory holding the queued uploads."""
+
+    def __init__(self, jobs_dir=JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.db_path = os.path.join(jobs_dir, "jobs.db")
+        self.db = SharedDB(
+            self.db_path,
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"  # queued | running | done | failed
+            " lang TEXT NOT NULL,"
+            " punctuate INTEGER NOT NULL,"
+            " audio_path TEXT NOT NULL,"
+            " worker INTEGER,"  # pid of the process running it
+            " chunks_done INTEGER NOT NULL DEFAULT 0,"
+            " chunks_total INTEGER,"
+            " result TEXT,"
+            " error TEXT,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)",
+            timeout=10,
+        )
+
+    def submit(self, audio_stream, lang_code, punctuate):
+        """Persist the upload and queue a job for it. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        audio_path = os.path.join(self.jobs_dir, f"{job_id}.upload")
+        try:
+            with open(audio_path, "wb") as f:
+                while True:
+                    block = audio_stream.read(1 << 20)
+                    if not block:
+                        break
+                    f.write(block)
+        except Exception:
+            # e.g. the upload was cut off: don't keep half of it around
+            os.remove(audio_path)
+            raise
+
+        now = time.time()
+        with self.db.connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, lang, punctuate, audio_path, created, updated)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, lang_code, int(punctuate), audio_path, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        """Job as a dict for GET /jobs/<id>, or None if unknown."""
+        with self.db.connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, lang, chunks_done, chunks_total, result, error, created, updated"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "lang": row[2],
+            "progress": {"chunks_done": row[3], "chunks_total": row[4]},
+            "created": row[7],
+            "updated": row[8],
+        }
+        if row[5] is not None:
+            job["result"] = json.loads(row[5])
+        if row[6] is not None:
+            job["error"] = row[6]
+        return job
+
+    def claim(self):
+        """
+        Atomically move the oldest queued job to running, owned by this
+        process, and return it (or None).
+        """
+        with self.db.connect() as conn:
+            # take the write lock before reading so two workers can't pick the same job
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, lang, punctuate, audio_path FROM jobs"
+                " WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, updated = ? WHERE id = ?",
+                    (os.getpid(), time.time(), row[0]),
+                )
+        if row is None:
+            return None
+        return {"id": row[0], "lang": row[1], "punctuate": bool(row[2]), "audio_path": row[3]}
+
+    def set_progress(self, job_id, chunks_done, chunks_total):
+        with self.db.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET chunks_done = ?, chunks_total = ?, updated = ? WHERE id = ?",
+                (chunks_done, chunks_total, time.time(), job_id),
+            )
+
+    def finish(self, job_id, result):
+        self._complete(job_id, "done", result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id, error):
+        self._complete(job_id, "failed", error=error)
+
+    def _complete(self, job_id, status, result=None, error=None):
+        with self.db.connect() as conn:
+            row = conn.execute("SELECT audio_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+        # the upload is only needed until the job has an outcome
+        if row is not None:
+            try:
+                os.remove(row[0])
+            except OSError:
+                pass
+
+    def requeue(self, job_id):
+        """Put a claimed job back in the queue to be run again from the start."""
+        with self.db.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', chunks_done = 0, worker = NULL, updated = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def requeue_worker(self, pid):
+        """Put the jobs a dead worker process was running back in the queue. Returns how many."""
+        with self.db.connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', chunks_done = 0, worker = NULL, updated = ?"
+                " WHERE status = 'running' AND worker = ?",
+                (time.time(), pid),
+            )
+            return cur.rowcount
+
+    def requeue_running(self):
+        """Put jobs interrupted by a shutdown back in the queue. Returns how many."""
+        with self.db.connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', chunks_done = 0, worker = NULL, updated = ?"
+                " WHERE status = 'running'",
+                (time.time(),),
+            )
+            return cur.rowcount
+
+
+def process_job(store, job):
+    """
+    Run the /transcribe pipeline for one claimed job, recording progress.
+    A job the recognizer refuses (rate limit, open circuit) goes back in the
+    queue instead of failing.
+    """
+    import admission
+    import app as stt_app
+    from metrics import Trace
+    from recognition import iter_recognize_chunks
+    from transcript import normalize_whitespace
+
+    job_id = job["id"]
+    trace = Trace("job", request_id=job_id)
+    chunks = recognize = None
+    status = 200
+    try:
+        with open(job["audio_path"], "rb") as f:
+            chunks = stt_app.load_chunks(f)
+            recognize = stt_app.make_recognizer(chunks.noise_floor, time.monotonic() + JOB_DEADLINE, trace)
+            raw_transcripts = {}
+            with trace.span("recognize"):
+                for i, text in iter_recognize_chunks(
+                    chunks,
+                    recognize,
+                    job["lang"],
+                    max_workers=stt_app.app.config["STT_MAX_CONCURRENCY"],
+                    timeout=JOB_DEADLINE,
+                ):
+                    raw_transcripts[i] = normalize_whitespace(text)
+                    # chunks are planned while decoding, so the total grows until the end
+                    store.set_progress(job_id, len(raw_transcripts), len(chunks.spans))
+
+        raw_transcripts = [raw_transcripts[i] for i in range(len(chunks.spans))]
+        result = stt_app.build_payload(chunks.spans, raw_transcripts, job["lang"], job["punctuate"], trace)
+        result["cache"] = recognize.stats()
+        store.finish(job_id, result)
+    except admission.Overloaded as e:
+        # not the job's fault: run it again once the recognizer takes calls
+        status = e.status
+        print(f"[⚠️ Job {job_id} re-queued, recognizer overloaded]: {e}")
+        store.requeue(job_id)
+    except Exception as e:
+        payload, status = stt_app.error_payload(e)
+        print(f"[⚠️ Job {job_id} failed]: {e}")
+        store.fail(job_id, payload["error"])
+    finally:
+        if chunks is not None:
+            stt_app.record_chunks(trace, chunks)
+        if recognize is not None:
+            trace.cache = recognize.stats()
+        trace.finish(stt_app.app.config["STT_METRICS"], status)
+
+
+def run_worker(jobs_dir=JOBS_DIR):
+    """Worker process loop: claim and process jobs until terminated."""
+    # the supervisor handles Ctrl-C and stops us with SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import admission
+    import app as stt_app
+
+    store = JobStore(jobs_dir)
+    config = stt_app.app.config
+    while True:
+        # while the recognizer is down or out of tokens, leave the queue alone
+        try:
+            admission.admit(config["STT_RATE_LIMITER"], config["STT_CIRCUIT_BREAKER"], config["STT_RATE_MAX_WAIT"])
+        except admission.Overloaded as e:
+            time.sleep(e.retry_after)
+            continue
+        job = store.claim()
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        process_job(store, job)
+
+
+def main(processes, jobs_dir=JOBS_DIR):
+    """Start `processes` workers and restart any that exit, re-queuing the job they had."""
+    store = JobStore(jobs_dir)
+    requeued = store.requeue_running()
+    print(f"[INFO] Job workers: {processes} processes, {requeued} interrupted jobs re-queued.")
+
+    workers = []
+
+    def stop(signum, frame):
+        for proc in workers:
+            proc.terminate()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def spawn():
+        proc = multiprocessing.Process(target=run_worker, args=(jobs_dir,), daemon=True)
+        proc.start()
+        return proc
+
+    workers.extend(spawn() for _ in range(processes))
+    while True:
+        time.sleep(1)
+        for i, proc in enumerate(workers):
+            if not proc.is_alive():
+                # before spawning, so a new worker can't reuse the pid first
+                requeued = store.requeue_worker(proc.pid)
+                print(f"[⚠️ Job worker {proc.pid} exited ({proc.exitcode}), restarting; "
+                      f"{requeued} jobs re-queued]")
+                workers[i] = spawn()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background transcription workers")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("STT_JOB_WORKERS", "2")))
+    parser.add_argument("--jobs-dir", default=JOBS_DIR)
+    args = parser.parse_args()
+    main(args.processes, args.jobs_dir)
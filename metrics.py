@@ -0,0 +1,284 @@
+# metrics.py
+"""
+Request timing and Prometheus metrics.
+
+A Trace follows one request: stage spans ("decode", "segment", "recognize",
+"merge", ...), the audio duration and the chunk count. When the request
+ends the trace is logged on one [INFO] line and folded into the process
+registry as counters and histograms.
+
+GET /metrics renders the registry in the Prometheus text format. Every
+gunicorn worker (and job worker) has its own registry, so with STT_METRICS_DB
+set each process writes a snapshot of its registry to that SQLite file after
+every request and /metrics sums the snapshots of all processes, including
+ones that have since exited, so counters never go backwards on a restart.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from shared_db import SharedDB
+
+# seconds; covers a cached chunk up to a long upload
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120)
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+HELP = {
+    "stt_requests_total": ("counter", "Transcription requests by endpoint and status."),
+    "stt_request_seconds": ("histogram", "Wall time of transcription requests."),
+    "stt_stage_seconds": ("histogram", "Time spent in each pipeline stage per request."),
+    "stt_recognize_call_seconds": ("histogram", "Latency of single recognizer calls (cache misses)."),
+    "stt_audio_seconds_total": ("counter", "Seconds of audio transcribed."),
+    "stt_chunks_total": ("counter", "Chunks sent to recognition."),
+    "stt_cache_lookups_total": ("counter", "Recognition cache lookups by result."),
+    "stt_realtime_factor": ("histogram", "Request wall time divided by audio duration."),
+    "stt_recognizer_retries_total": ("counter", "Failed recognizer calls that were retried."),
+}
+
+
+class Registry:
+    """Counters and histograms of one process; thread-safe."""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.buckets = {}  # name -> bucket bounds
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.buckets.setdefault(name, buckets)
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[len(buckets)] += 1
+            hist[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, list(labels), list(hist)] for (name, labels), hist in self.histograms.items()],
+                "buckets": {name: list(bounds) for name, bounds in self.buckets.items()},
+            }
+
+
+def merge_snapshots(snapshots):
+    """Sum per-process snapshots into one."""
+    counters, histograms, buckets = {}, {}, {}
+    for snap in snapshots:
+        buckets.update(snap["buckets"])
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, hist in snap["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.get(key)
+            histograms[key] = list(hist) if total is None else [a + b for a, b in zip(total, hist)]
+    return counters, histograms, buckets
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render(snapshots):
+    """Prometheus text exposition format for the summed snapshots."""
+    counters, histograms, buckets = merge_snapshots(snapshots)
+    lines = []
+    for name in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            bounds = buckets[name]
+            for bound, count in zip(bounds, hist):
+                lines.append(f"{name}_bucket{_labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {hist[len(bounds)]}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist[-1]:g}")
+            lines.append(f"{name}_count{_labels(labels)} {hist[len(bounds)]}")
+    return "\n".join(lines) + "\n"
+
+
+class SnapshotStore:
+    """Per-process registry snapshots in a SQLite file shared by all workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = SharedDB(
+            path,
+            "CREATE TABLE IF NOT EXISTS metric_snapshots ("
+            " process TEXT PRIMARY KEY, snapshot TEXT NOT NULL, updated REAL NOT NULL)",
+        )
+
+    def save(self, process, snapshot):
+        with self.db.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO metric_snapshots (process, snapshot, updated) VALUES (?, ?, ?)",
+                (process, json.dumps(snapshot), time.time()),
+            )
+
+    def load_all(self):
+        rows = self.db.connect().execute("SELECT snapshot FROM metric_snapshots").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class Metrics:
+    """The process registry plus the optional shared snapshot store."""
+
+    def __init__(self, db_path=None):
+        self.registry = Registry()
+        self.store = SnapshotStore(db_path) if db_path else None
+        self._process = None
+
+    def _process_id(self):
+        # unique per process, also across a fork and pid reuse
+        if self._process is None or self._process[0] != os.getpid():
+            self._process = (os.getpid(), f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        return self._process[1]
+
+    def flush(self):
+        if self.store is None:
+            return
+        try:
+            self.store.save(self._process_id(), self.registry.snapshot())
+        except sqlite3.Error as e:
+            print(f"[⚠️ Metrics write error]: {e}")
+
+    def render(self):
+        snapshots = [self.registry.snapshot()]
+        if self.store is not None:
+            self.flush()
+            try:
+                snapshots = self.store.load_all()
+            except sqlite3.Error as e:
+                print(f"[⚠️ Metrics read error]: {e}")
+        return render(snapshots)
+
+
+class Trace:
+    """
+    Timing of one request. span(stage) times a block; add(stage, seconds)
+    records time measured elsewhere (e.g. inside the ingest stream). Stages
+    may repeat (their times add up) and may be recorded from any thread.
+    """
+
+    def __init__(self, endpoint, request_id=None):
+        self.endpoint = endpoint
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.stages = {}
+        self.audio_seconds = 0.0
+        self.chunks = 0
+        self.cache = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def timed(self, stage, fn, metrics=None):
+        """Wrap fn so every call adds to `stage` (and to the call histogram)."""
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                self.add(stage, elapsed)
+                if metrics is not None:
+                    metrics.registry.observe("stt_recognize_call_seconds", elapsed)
+        return call
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._started
+        return {
+            "request_id": self.request_id,
+            "total_s": round(elapsed, 4),
+            "audio_s": round(self.audio_seconds, 3),
+            "chunks": self.chunks,
+            "rtf": round(elapsed / self.audio_seconds, 4) if self.audio_seconds else None,
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+        }
+
+    def server_timing(self):
+        """Server-Timing header value (milliseconds per stage)."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+    def finish(self, metrics, status):
+        """Log the trace on one line and record it in the registry."""
+        summary = self.summary()
+        stages = " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in summary["stages"].items())
+        print(f"[INFO] {self.endpoint} {self.request_id} status={status} total={summary['total_s']:.3f}s "
+              f"audio={summary['audio_s']:.1f}s chunks={self.chunks} rtf={summary['rtf']} {stages}")
+
+        registry = metrics.registry
+        registry.inc("stt_requests_total", endpoint=self.endpoint, status=str(status))
+        registry.observe("stt_request_seconds", summary["total_s"], endpoint=self.endpoint)
+        for stage, seconds in self.stages.items():
+            registry.observe("stt_stage_seconds", seconds, stage=stage)
+        if self.audio_seconds:
+            registry.inc("stt_audio_seconds_total", self.audio_seconds)
+            registry.observe("stt_realtime_factor", summary["rtf"], buckets=RTF_BUCKETS)
+        registry.inc("stt_chunks_total", self.chunks)
+        if self.cache:
+            registry.inc("stt_cache_lookups_total", self.cache["hits"], result="hit")
+            registry.inc("stt_cache_lookups_total", self.cache["misses"], result="miss")
+        metrics.flush()
+        return summary
+
+
+@contextmanager
+def profiled(enabled, limit=25):
+    """
+    cProfile the block when enabled; yields a dict whose "profile" key holds
+    the pstats summary (top functions by cumulative time) afterwards. Only
+    the calling thread is profiled: recognizer calls run on the pool threads
+    and show up as time spent waiting for them.
+    """
+    result = {}
+    if not enabled:
+        yield result
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        result["profile"] = out.getvalue()
@@ -0,0 +1,147 @@
+# punctuation.py
+"""
+Optional English punctuation with DeepSegment, loaded lazily and batched.
+
+The model is only loaded on the first English request that asks for
+punctuation, so kn-IN-only workers never pay for it. Setting
+STT_PRELOAD_PUNCTUATION=1 loads it at import instead; combined with
+gunicorn's --preload the master loads it once and workers share its pages
+copy-on-write.
+
+All segmentation runs on one background thread that drains a small queue:
+texts from concurrent requests are windowed like DeepSegment.segment_long
+and the windows of every pending text go through a single batched
+DeepSegment.segment call per step.
+"""
+import importlib.util
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+N_WINDOW = 10     # words per window, DeepSegment.segment_long's default
+MAX_BATCH = 16    # texts segmented together
+BATCH_WAIT = 0.02  # seconds to wait for more texts before running a batch
+
+_segmenter = None
+_load_error = None
+_load_lock = threading.Lock()
+_batcher = None
+
+
+def available():
+    """True if DeepSegment is installed (without loading the model)."""
+    return _load_error is None and importlib.util.find_spec("deepsegment") is not None
+
+
+def get_segmenter():
+    """Load DeepSegment("en") once per process; raises if it can't be loaded."""
+    global _segmenter, _load_error
+    if _segmenter is not None:
+        return _segmenter
+    with _load_lock:
+        if _segmenter is None:
+            if _load_error is not None:
+                raise RuntimeError(_load_error)
+            try:
+                from deepsegment import DeepSegment
+
+                started = time.monotonic()
+                _segmenter = DeepSegment("en")
+                print(f"[INFO] DeepSegment loaded for English punctuation "
+                      f"({time.monotonic() - started:.1f}s).")
+            except Exception as e:
+                _load_error = f"DeepSegment unavailable: {e}"
+                print(f"[INFO] DeepSegment NOT available — punctuation disabled for English. ({e})")
+                raise RuntimeError(_load_error)
+    return _segmenter
+
+
+def segment_long_batch(segmenter, texts, n_window=N_WINDOW):
+    """
+    DeepSegment.segment_long for several texts at once.
+
+    Each text is fed in windows of n_window words; the last (unfinished)
+    sentence of a window is carried into the next one. Step i runs window i
+    of every text still in progress through one segment() call.
+    """
+    remaining = [text.split() for text in texts]
+    prefixes = [[] for _ in texts]
+    results = [[] for _ in texts]
+
+    while True:
+        active = [i for i, words in enumerate(remaining) if words]
+        if not active:
+            break
+
+        windows = []
+        for i in active:
+            take = max(n_window - len(prefixes[i]), 0) or n_window
+            windows.append(" ".join(prefixes[i] + remaining[i][:take]))
+            remaining[i] = remaining[i][take:]
+
+        for i, sentences in zip(active, segmenter.segment(windows)):
+            results[i].extend(sentences[:-1])
+            prefixes[i] = sentences[-1].split() if sentences else []
+
+    for i, prefix in enumerate(prefixes):
+        if prefix:
+            results[i].append(" ".join(prefix))
+    return results
+
+
+class Batcher:
+    """Single background thread that segments queued texts in batches."""
+
+    def __init__(self, max_batch=MAX_BATCH, batch_wait=BATCH_WAIT):
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="punctuation", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                results = segment_long_batch(get_segmenter(), texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), sentences in zip(batch, results):
+                future.set_result(sentences)
+
+
+def segment_long(text):
+    """Sentences for text, via the shared batcher. Raises on model errors."""
+    global _batcher
+    if _batcher is None:
+        with _load_lock:
+            if _batcher is None:
+                _batcher = Batcher()
+    return _batcher.submit(text).result()
+
+
+if os.environ.get("STT_PRELOAD_PUNCTUATION"):
+    try:
+        get_segmenter()
+    except RuntimeError:
+        pass
@@ -0,0 +1,172 @@
+# recognition.py
+"""
+Concurrent chunk recognition.
+
+Chunks are sent to the recognizer through a bounded thread pool and the
+texts are returned in chunk order. The whole batch shares one deadline, and
+the first RequestError stops any chunk that has not started yet.
+
+The recognizer is any callable with the signature of
+Recognizer.recognize_google: recognize(audio_data, language=...) -> str,
+raising sr.UnknownValueError for unintelligible audio and sr.RequestError
+for API/network failures.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import speech_recognition as sr
+
+
+class RecognitionTimeout(Exception):
+    """Raised when the chunks could not all be recognized before the deadline."""
+
+
+def _task(recognize, language, stop):
+    def work(audio_data):
+        # queued chunks can still be picked up between the failure and the
+        # cancel below, so check before spending a round trip
+        if stop.is_set():
+            return ""
+        try:
+            return recognize(audio_data, language=language)
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError:
+            stop.set()
+            raise
+    return work
+
+
+def iter_recognize_chunks(audio_chunks, recognize, language, max_workers=4, timeout=None):
+    """
+    Recognize every AudioData in audio_chunks, yielding (index, text) as each
+    chunk finishes (not necessarily in order).
+
+    Unintelligible chunks come back as "". At most max_workers calls run at
+    once. If timeout (seconds) elapses first, RecognitionTimeout is raised;
+    a RequestError from any chunk is re-raised. In both cases, and when the
+    caller stops iterating early, chunks that have not started are cancelled
+    and the pool is released without waiting for calls already in flight.
+
+    audio_chunks may be a generator. It is consumed lazily on a separate
+    thread, keeping at most 2 * max_workers chunks submitted at a time, so a
+    finished text is yielded even while the next chunk is still being
+    decoded (or uploaded), and a streaming source is only read as fast as
+    chunks are used. The pool drops each chunk once it has been recognized,
+    so finished chunk audio is not kept alive here. An exception raised by
+    audio_chunks is re-raised here.
+    """
+    stop = threading.Event()
+    work = _task(recognize, language, stop)
+
+    started = time.monotonic()
+    max_workers = max(1, max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recognize")
+    # (index, future) as chunks finish; (count, None) once all are submitted;
+    # (None, exception) if audio_chunks failed
+    finished = queue.Queue()
+    slots = threading.Semaphore(2 * max_workers)
+
+    def submit_all():
+        count = 0
+        try:
+            for i, chunk in enumerate(audio_chunks):
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                future = executor.submit(work, chunk)
+                future.add_done_callback(lambda f, i=i: finished.put((i, f)))
+                count += 1
+        except Exception as e:
+            finished.put((None, e))
+            return
+        finished.put((count, None))
+
+    threading.Thread(target=submit_all, name="recognize-feed", daemon=True).start()
+    try:
+        total, done = None, 0
+        while total is None or done < total:
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                raise FuturesTimeout()
+            try:
+                i, item = finished.get(timeout=remaining)
+            except queue.Empty:
+                raise FuturesTimeout()
+            if item is None:
+                total = i
+            elif i is None:
+                raise item
+            else:
+                done += 1
+                slots.release()
+                yield i, item.result()
+    except FuturesTimeout:
+        elapsed = time.monotonic() - started
+        raise RecognitionTimeout(
+            f"recognition did not finish within {timeout:.1f}s ({elapsed:.1f}s elapsed)"
+        ) from None
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def recognize_chunks(audio_chunks, recognize, language, max_workers=4, timeout=None):
+    """
+    Recognize every AudioData in audio_chunks (any iterable) and return the
+    texts in order.
+
+    Same concurrency, deadline and cancellation behaviour as
+    iter_recognize_chunks.
+    """
+    results = {}
+    for i, text in iter_recognize_chunks(audio_chunks, recognize, language, max_workers, timeout):
+        results[i] = text
+    return [results[i] for i in range(len(results))]
+
+
+class LiveRecognition:
+    """
+    Recognition of chunks that become available one at a time, such as the
+    segments of a live stream.
+
+    submit() queues a chunk and returns its index at once; finished() returns
+    the (index, text) pairs completed since the last call without blocking,
+    so the caller can keep reading audio in between; drain() waits for the
+    rest. Same semantics as iter_recognize_chunks otherwise: unintelligible
+    chunks come back as "", and the first RequestError is raised from
+    finished()/drain() and stops the chunks that have not started.
+    """
+
+    def __init__(self, recognize, language, max_workers=4):
+        self._stop = threading.Event()
+        self._work = _task(recognize, language, self._stop)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="recognize")
+        self._pending = {}
+        self._count = 0
+
+    def submit(self, audio_data):
+        index = self._count
+        self._count += 1
+        self._pending[self._executor.submit(self._work, audio_data)] = index
+        return index
+
+    def finished(self):
+        done = [future for future in self._pending if future.done()]
+        return [(self._pending.pop(future), future.result()) for future in done]
+
+    def drain(self, timeout=None):
+        """Wait for every submitted chunk; RecognitionTimeout after timeout seconds."""
+        done, not_done = wait(self._pending, timeout=timeout)
+        if not_done:
+            raise RecognitionTimeout(f"{len(not_done)} chunks were not recognized within {timeout:.1f}s")
+        return self.finished()
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,37 @@
+# shared_db.py
+"""
+SQLite files shared by every gunicorn worker and job worker on the host.
+
+The recognition cache, the metrics snapshots, the rate limiter and the job
+queue each keep their cross-process state in such a file. SharedDB creates
+the schema in WAL mode, so readers don't block the writer, and hands each
+thread of each process its own connection.
+"""
+import os
+import sqlite3
+import threading
+
+
+class SharedDB:
+    """A SQLite file with the given schema statements, one connection per thread and process."""
+
+    def __init__(self, path, *schema, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in schema:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+
+    def connect(self):
+        """This thread's connection; `with db.connect() as conn:` commits on success."""
+        # a forked child must not reuse the parent's connection
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=self.timeout)
+            self._local.pid = os.getpid()
+        return self._local.conn
@@ -1,18 +1,24 @@
-import requests
+import argparse
 import sounddevice as sd
-import soundfile as sf
-import tempfile
 import os
+import queue
+import threading
 import webbrowser
 import numpy as np
 import scipy.signal
-from pydub import AudioSegment, silence
-import re
+
+import ingest
+import vad
+from chunking import plan_chunks
+from client import STTClient, replay_frames
+from transcript import merge_transcripts_with_dedup
 
 # CONFIGURATION
 TOTAL_DURATION = 30   # Max recording time (seconds)
 SAMPLE_RATE = 16000
 SERVER_URL = "https://kannada-stt.onrender.com/transcribe"
+MAX_IN_FLIGHT = 4     # chunk uploads at once
+LIVE_FRAME_MS = 100   # live mode: audio sent per frame
 AUTO_SAVE_TRANSCRIPT = True
 
 
@@ -37,93 +43,108 @@ def record_full_audio(duration=TOTAL_DURATION, samplerate=SAMPLE_RATE):
     sd.wait()
     audio = apply_highpass_filter(audio, samplerate)
 
-    temp_wav = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-    sf.write(temp_wav.name, audio, samplerate)
-    print(f"✅ Audio saved at {temp_wav.name}")
-    return temp_wav.name
+    # keep it in memory as int16, the format the chunks are uploaded in
+    samples = (np.clip(audio[:, 0], -1.0, 1.0) * 32767).astype(np.int16)
+    print(f"✅ Recorded {len(samples) / samplerate:.1f}s of audio")
+    return samples
 
 
-def chunk_audio_by_silence(audio_path):
+def chunk_audio_by_silence(samples, samplerate=SAMPLE_RATE):
     print("\n🔍 Splitting audio using silence detection...")
-    audio = AudioSegment.from_wav(audio_path).set_channels(1).set_frame_rate(16000)
 
-    primary_chunks = silence.split_on_silence(
-        audio,
+    primary_ranges = vad.split_on_silence(
+        samples,
+        samplerate,
         min_silence_len=800,
-        silence_thresh=audio.dBFS - 14,
+        silence_thresh=vad.dbfs(samples) - 14,
         keep_silence=300
     )
 
-    valid_chunks = []
-    current = AudioSegment.silent(duration=0)
-    overlap = AudioSegment.silent(duration=500)  # 0.5s overlap
-
-    for chunk in primary_chunks:
-        if len(chunk) < 1000:
-            continue
-        if len(current) + len(chunk) <= 30000:
-            current += chunk + overlap
-        else:
-            if len(current) > 1000:
-                valid_chunks.append(current)
-            current = chunk
-
-    if len(current) > 1000:
-        valid_chunks.append(current)
+    # plan on offsets, then take each chunk as a view of the recording
+    total_ms = vad.duration_ms(samples, samplerate)
+    spans = plan_chunks(primary_ranges, total_ms, max_chunk_ms=30000, overlap_ms=500, min_piece_ms=1000)
+    valid_chunks = [
+        samples[start * samplerate // 1000:end * samplerate // 1000]
+        for start, end in spans if end - start > 1000
+    ]
 
     print(f"✅ Created {len(valid_chunks)} valid chunks.")
     return valid_chunks
 
 
-def merge_transcripts_with_dedup(transcripts, max_overlap_words=3):
-    """Merge transcripts while removing repeated overlap at boundaries."""
-    if not transcripts:
-        return ""
-    merged = transcripts[0].strip()
-    for nxt in transcripts[1:]:
-        prev_words = merged.split()
-        next_words = nxt.strip().split()
-        overlap_found = 0
-        for k in range(max_overlap_words, 0, -1):
-            if len(prev_words) >= k and len(next_words) >= k:
-                if prev_words[-k:] == next_words[:k]:
-                    overlap_found = k
-                    break
-        if overlap_found:
-            merged += " " + " ".join(next_words[overlap_found:])
-        else:
-            merged += " " + " ".join(next_words)
-    return re.sub(r"\s+", " ", merged).strip()
-
-
-def send_chunk_to_server(chunk_audio, chunk_index, language):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as chunk_file:
-        chunk_audio.export(chunk_file.name, format="wav")
-        chunk_path = chunk_file.name
-
-    print(f"📡 Sending chunk {chunk_index} to server...")
+def send_chunks_to_server(chunks, language):
+    """Upload the chunks as FLAC, several at a time over pooled connections."""
+    print(f"📡 Sending {len(chunks)} chunks to server...")
 
+    def report(index, transcript):
+        if transcript:
+            print(f"✅ Chunk {index + 1} transcript:\n{transcript}\n")
+
+    with STTClient(SERVER_URL, language, max_in_flight=MAX_IN_FLIGHT) as client:
+        return client.transcribe_chunks(chunks, SAMPLE_RATE, on_result=report)
+
+
+def microphone_frames(stop, samplerate=SAMPLE_RATE, frame_ms=LIVE_FRAME_MS):
+    """Yield high-passed int16 frames from the microphone until stop is set."""
+    frames = queue.Queue()
+
+    def callback(indata, n_frames, time_info, status):
+        frames.put(indata[:, 0].copy())
+
+    # same filter as apply_highpass_filter, run causally with carried state
+    b, a = scipy.signal.butter(1, 100.0 / (0.5 * samplerate), btype="high", analog=False)
+    zi = np.zeros(max(len(a), len(b)) - 1)
+    blocksize = samplerate * frame_ms // 1000
+    with sd.InputStream(samplerate=samplerate, channels=1, dtype="float32",
+                        blocksize=blocksize, callback=callback):
+        while not stop.is_set():
+            try:
+                block = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            filtered, zi = scipy.signal.lfilter(b, a, block, zi=zi)
+            yield (np.clip(filtered, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def file_frames(stop, path, frame_ms=LIVE_FRAME_MS):
+    """Fake microphone: replay an audio file in real time until it ends or stop is set."""
+    with open(path, "rb") as f:
+        samples = np.concatenate(list(ingest.iter_pcm(f)))
+    for frame in replay_frames(samples, frame_ms):
+        if stop.is_set():
+            break
+        yield frame
+
+
+def live_transcribe(language, replay_path=None):
+    """Stream audio to the server as it is captured and print text as each utterance ends."""
+    stop = threading.Event()
+    frames = file_frames(stop, replay_path) if replay_path else microphone_frames(stop)
+    result = {}
+
+    def report(segment):
+        print(f"✅ [{segment['start_ms'] / 1000:.1f}s-{segment['end_ms'] / 1000:.1f}s] {segment['text']}")
+
+    def run():
+        try:
+            with STTClient(SERVER_URL, language) as client:
+                result.update(client.stream_live(frames, on_segment=report))
+        except Exception as e:
+            print(f"❌ Live transcription failed: {e}")
+
+    print("\n🎙️ Live mode: speak, press Ctrl+C to stop." if not replay_path
+          else f"\n▶️ Replaying {replay_path} as the microphone...")
+    worker = threading.Thread(target=run)
+    worker.start()
     try:
-        punct_param = "&punctuate=1" if language.startswith("en") else ""
-        with open(chunk_path, "rb") as f:
-            response = requests.post(
-                f"{SERVER_URL}?lang={language}{punct_param}",
-                files={"audio": f}
-            )
-        os.remove(chunk_path)
-
-        if response.ok:
-            result = response.json()
-            transcript = result.get("punctuated") or result.get("transcript", "")
-            transcript = transcript.strip()
-            print(f"✅ Chunk {chunk_index} transcript:\n{transcript}\n")
-            return transcript
-        else:
-            print(f"❌ Server error [{response.status_code}]: {response.text}")
-            return ""
-    except Exception as e:
-        print(f"❌ Error sending chunk {chunk_index}: {e}")
-        return ""
+        while worker.is_alive():
+            worker.join(timeout=0.2)
+    except KeyboardInterrupt:
+        # stop capturing; the server still returns the segments in flight
+        stop.set()
+        worker.join()
+
+    return result.get("punctuated") or result.get("transcript", "")
 
 
 def save_transcript(text, filename="full_transcript.txt"):
@@ -137,18 +158,22 @@ def save_transcript(text, filename="full_transcript.txt"):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kannada/English STT test client")
+    parser.add_argument("--live", action="store_true", help="stream from the microphone as you speak")
+    parser.add_argument("--replay", metavar="AUDIO_FILE", help="live mode, replaying a file as the microphone")
+    args = parser.parse_args()
+
     selected_language = choose_language()
-    audio_path = record_full_audio()
-    chunks = chunk_audio_by_silence(audio_path)
+    if args.live or args.replay:
+        full_transcript = live_transcribe(selected_language, args.replay)
+    else:
+        samples = record_full_audio()
+        chunks = chunk_audio_by_silence(samples)
 
-    all_transcripts = []
-    for idx, chunk in enumerate(chunks, 1):
-        transcript = send_chunk_to_server(chunk, idx, selected_language)
-        if transcript:
-            all_transcripts.append(transcript)
+        all_transcripts = [t for t in send_chunks_to_server(chunks, selected_language) if t]
 
-    # Merge with deduplication
-    full_transcript = merge_transcripts_with_dedup(all_transcripts)
+        # Merge with deduplication
+        full_transcript = merge_transcripts_with_dedup(all_transcripts)
 
     if full_transcript:
         print("\n📄 Final Combined Transcript:\n")
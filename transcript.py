@@ -0,0 +1,65 @@
+# transcript.py
+"""
+Transcript merging shared by the API and the client.
+
+Pure Python with no audio dependencies, so test_api.py can import it on a
+machine that only records and uploads.
+"""
+import re
+
+
+def normalize_whitespace(s: str) -> str:
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def _overlap(prev_tail, next_words, max_overlap_words):
+    """Longest k <= max_overlap_words where prev_tail ends with next_words[:k]."""
+    for k in range(max_overlap_words, 0, -1):
+        if len(prev_tail) >= k and len(next_words) >= k:
+            if prev_tail[-k:] == next_words[:k]:
+                return k
+    return 0
+
+
+def merge_segments(segments, max_overlap_words=3):
+    """
+    Merge timed chunk transcripts, removing repeated words at each boundary.
+
+    segments is an iterable of (start_ms, end_ms, text). Empty texts are
+    dropped. Returns (merged_text, timed) where timed is a list of
+    {"start_ms", "end_ms", "text"} dicts holding each segment's text after
+    its duplicated prefix was removed.
+
+    The merged transcript is kept as a word list, so each boundary only
+    compares the last max_overlap_words words instead of re-splitting
+    everything merged so far.
+    """
+    words = []
+    timed = []
+    for start_ms, end_ms, text in segments:
+        next_words = text.split()
+        if not next_words:
+            continue
+
+        # test overlaps length from max_overlap_words down to 1
+        overlap_found = _overlap(words[-max_overlap_words:], next_words, max_overlap_words)
+        kept = next_words[overlap_found:]
+        words.extend(kept)
+        timed.append({"start_ms": start_ms, "end_ms": end_ms, "text": " ".join(kept)})
+
+    return " ".join(words), timed
+
+
+def merge_transcripts_with_dedup(transcripts, max_overlap_words=3):
+    """
+    Join chunk transcripts with a simple overlap-deduplication heuristic.
+    Looks for an overlap of up to max_overlap_words between the end of the previous
+    transcript and the start of the next transcript and removes duplicates.
+    Returns a single merged string.
+    """
+    words = []
+    for nxt in transcripts:
+        next_words = nxt.split()
+        overlap_found = _overlap(words[-max_overlap_words:], next_words, max_overlap_words)
+        words.extend(next_words[overlap_found:])
+    return " ".join(words)
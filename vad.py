@@ -0,0 +1,320 @@
+# vad.py
+"""
+Vectorized silence detection on raw PCM.
+
+Drop-in replacement for pydub.silence.split_on_silence that works on a NumPy
+array of samples instead of slicing an AudioSegment once per millisecond.
+Window energies come from a cumulative sum of squared samples, and silent
+windows are grouped into ranges with a run-length pass, so the whole scan is
+a handful of array operations regardless of recording length.
+
+All positions are in milliseconds, matching pydub.
+
+LiveSegmenter segments audio incrementally as it arrives, for live streams
+where the loudness of the whole recording is not known up front.
+"""
+import numpy as np
+
+# square at most this much audio at a time to keep int64 temporaries small
+_SLICE_MS = 60000
+_SLICE_FRAMES = 1 << 20
+
+
+def max_possible_amplitude(samples: np.ndarray) -> float:
+    """Full-scale amplitude for the sample dtype (32768 for int16, like pydub)."""
+    return float(2 ** (samples.dtype.itemsize * 8 - 1))
+
+
+def duration_ms(samples: np.ndarray, sample_rate: int) -> int:
+    """Length in milliseconds, rounded the same way as len(AudioSegment)."""
+    return round(1000 * (len(samples) / sample_rate))
+
+
+def dbfs(samples: np.ndarray) -> float:
+    """Loudness of the whole buffer in dBFS (-inf for digital silence)."""
+    if len(samples) == 0:
+        return -float("inf")
+    sum_squares = sum(
+        int(np.square(samples[i:i + _SLICE_FRAMES], dtype=np.int64).sum())
+        for i in range(0, len(samples), _SLICE_FRAMES)
+    )
+    rms = int(np.sqrt(sum_squares / len(samples)))
+    if not rms:
+        return -float("inf")
+    return 20 * np.log10(rms / max_possible_amplitude(samples))
+
+
+def window_rms(samples: np.ndarray, sample_rate: int, window_ms: int) -> np.ndarray:
+    """
+    RMS of every window_ms-long window starting at each whole millisecond.
+
+    Element i is the RMS of [i, i + window_ms) ms, computed exactly like
+    audioop.rms on audio_segment[i:i + window_ms] (truncated to an integer,
+    zero-padded past the end of the buffer).
+    """
+    seg_len = duration_ms(samples, sample_rate)
+    if seg_len < window_ms:
+        return np.zeros(0, dtype=np.int64)
+
+    if sample_rate % 1000:
+        return _window_rms_generic(samples, sample_rate, window_ms, seg_len)
+
+    # energy of every millisecond, squared in slices to keep temporaries small
+    per_ms_frames = sample_rate // 1000
+    full_ms = len(samples) // per_ms_frames
+    ms_energy = np.zeros(seg_len, dtype=np.int64)
+    for start in range(0, full_ms, _SLICE_MS):
+        end = min(start + _SLICE_MS, full_ms)
+        block = samples[start * per_ms_frames:end * per_ms_frames]
+        ms_energy[start:end] = np.square(block, dtype=np.int64).reshape(-1, per_ms_frames).sum(axis=1)
+    if seg_len > full_ms:
+        # a trailing partial millisecond that rounds up, zero-padded like pydub
+        ms_energy[full_ms] = np.square(samples[full_ms * per_ms_frames:], dtype=np.int64).sum()
+
+    csum = np.concatenate(([0], np.cumsum(ms_energy)))
+    energy = (csum[window_ms:] - csum[:-window_ms]).astype(np.float64)
+    return np.sqrt(energy / (window_ms * per_ms_frames)).astype(np.int64)
+
+
+def _window_rms_generic(samples, sample_rate, window_ms, seg_len):
+    """window_rms for sample rates that aren't a whole number of frames per ms."""
+    sq = samples.astype(np.int64) ** 2
+    csum = np.concatenate(([0], np.cumsum(sq)))
+
+    starts_ms = np.arange(seg_len - window_ms + 1, dtype=np.int64)
+    start_frames = starts_ms * sample_rate // 1000
+    end_frames = (starts_ms + window_ms) * sample_rate // 1000
+    expected = end_frames - start_frames
+
+    clipped_end = np.minimum(end_frames, len(samples))
+    energy = (csum[clipped_end] - csum[start_frames]).astype(np.float64)
+    return np.sqrt(energy / expected).astype(np.int64)
+
+
+def _thresh_amplitude(samples: np.ndarray, silence_thresh: float) -> float:
+    return (10 ** (silence_thresh / 20)) * max_possible_amplitude(samples)
+
+
+def detect_silence(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, rms=None):
+    """
+    Returns a list of all silent sections [start, end] in milliseconds.
+
+    Same result as pydub.silence.detect_silence with seek_step=1. A window_rms
+    array for min_silence_len can be passed in to avoid recomputing it.
+    """
+    if rms is None:
+        rms = window_rms(samples, sample_rate, min_silence_len)
+    if len(rms) == 0:
+        return []
+
+    silent_starts = np.flatnonzero(rms <= _thresh_amplitude(samples, silence_thresh))
+    if len(silent_starts) == 0:
+        return []
+
+    # a new range begins wherever two silent windows no longer overlap
+    breaks = np.flatnonzero(np.diff(silent_starts) > min_silence_len)
+    range_starts = np.concatenate(([silent_starts[0]], silent_starts[breaks + 1]))
+    range_ends = np.concatenate((silent_starts[breaks], [silent_starts[-1]])) + min_silence_len
+
+    return [[int(s), int(e)] for s, e in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, rms=None):
+    """
+    Returns a list of all nonsilent sections [start, end] in milliseconds.
+    Inverse of detect_silence(), same result as pydub.silence.detect_nonsilent.
+    """
+    silent_ranges = detect_silence(samples, sample_rate, min_silence_len, silence_thresh, rms)
+    len_seg = duration_ms(samples, sample_rate)
+
+    # if there is no silence, the whole thing is nonsilent
+    if not silent_ranges:
+        return [[0, len_seg]]
+
+    # the whole buffer is silent
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+
+    if silent_ranges[-1][1] != len_seg:
+        nonsilent_ranges.append([prev_end, len_seg])
+
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+
+    return nonsilent_ranges
+
+
+def split_on_silence(samples, sample_rate, min_silence_len=1000, silence_thresh=-16,
+                     keep_silence=100, rms=None):
+    """
+    Returns [start, end] millisecond ranges of the pieces pydub.silence.split_on_silence
+    would produce for the same settings (seek_step=1).
+
+    Slice the source audio with these ranges to get the actual chunks.
+    """
+    len_seg = duration_ms(samples, sample_rate)
+    if isinstance(keep_silence, bool):
+        keep_silence = len_seg if keep_silence else 0
+
+    output_ranges = [
+        [start - keep_silence, end + keep_silence]
+        for start, end in detect_nonsilent(samples, sample_rate, min_silence_len, silence_thresh, rms)
+    ]
+
+    # when padding makes neighbours overlap, split the shared silence evenly
+    for range_i, range_ii in zip(output_ranges, output_ranges[1:]):
+        if range_ii[0] < range_i[1]:
+            range_i[1] = (range_i[1] + range_ii[0]) // 2
+            range_ii[0] = range_i[1]
+
+    return [[max(start, 0), min(end, len_seg)] for start, end in output_ranges]
+
+
+def noise_floor(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, rms=None):
+    """
+    Estimate background noise energy (RMS amplitude) for the whole recording.
+
+    Uses the median energy of the windows classified as silent; if the
+    recording has no silence, falls back to the quietest 10% of windows.
+    """
+    if rms is None:
+        rms = window_rms(samples, sample_rate, min_silence_len)
+    if len(rms) == 0:
+        if len(samples) == 0:
+            return 0.0
+        return float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+
+    silent = rms[rms <= _thresh_amplitude(samples, silence_thresh)]
+    if len(silent):
+        return float(np.median(silent))
+    return float(np.percentile(rms, 10))
+
+
+def segment(samples, sample_rate, min_silence_len=1000, silence_offset_db=14, keep_silence=100):
+    """
+    One-pass segmentation used by the API.
+
+    The silence threshold is relative to the loudness of the whole recording
+    (dBFS - silence_offset_db), like the original pydub settings. Returns
+    (ranges, noise_floor) where ranges are [start_ms, end_ms] pieces.
+    """
+    silence_thresh = dbfs(samples) - silence_offset_db
+    rms = window_rms(samples, sample_rate, min_silence_len)
+    ranges = split_on_silence(samples, sample_rate, min_silence_len, silence_thresh, keep_silence, rms)
+    floor = noise_floor(samples, sample_rate, min_silence_len, silence_thresh, rms)
+    return ranges, floor
+
+
+class LiveSegmenter:
+    """
+    Incremental silence segmentation for audio that arrives as it is spoken.
+
+    feed() takes int16 samples of any length and returns the segments it
+    closed: (start_ms, end_ms, samples) with offsets from the start of the
+    stream. Audio is judged in frame_ms frames against an energy threshold
+    that follows the background noise while nobody is speaking, the same
+    way sr.Recognizer.listen adapts (dynamic_energy_ratio 1.5, damping
+    0.15 per second). A segment closes once min_silence_len ms of silence
+    follow speech, keeping keep_silence ms of padding on both sides, or when
+    it reaches max_segment_ms. Segments with less than min_speech_ms of
+    speech are dropped as noise. flush() closes whatever is still open.
+    """
+
+    def __init__(self, sample_rate=16000, min_silence_len=800, keep_silence=300,
+                 max_segment_ms=30000, min_speech_ms=200, frame_ms=30, energy_threshold=300):
+        self.sample_rate = sample_rate
+        self.min_silence_len = min_silence_len
+        self.keep_silence = keep_silence
+        self.max_segment_ms = max_segment_ms
+        self.min_speech_ms = min_speech_ms
+        self.frame_ms = frame_ms
+        self.energy_threshold = float(energy_threshold)
+        self.dynamic_energy_ratio = 1.5
+        self.damping = 0.15 ** (frame_ms / 1000)
+
+        self._frame_len = sample_rate * frame_ms // 1000
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._pos_ms = 0  # start of the next frame
+        self._preroll = []  # recent silent frames, up to keep_silence ms
+        self._frames = None  # frames of the open segment, None when idle
+        self._start_ms = 0
+        self._speech_ms = 0
+        self._silent_frames = 0  # trailing silent frames in the open segment
+
+    def feed(self, samples):
+        closed = []
+        buf = np.concatenate((self._pending, samples)) if len(self._pending) else samples
+        n_frames = len(buf) // self._frame_len
+        for i in range(n_frames):
+            frame = buf[i * self._frame_len:(i + 1) * self._frame_len]
+            segment = self._frame(frame)
+            if segment is not None:
+                closed.append(segment)
+        self._pending = buf[n_frames * self._frame_len:].copy()
+        return closed
+
+    def flush(self):
+        """Close the open segment (if it holds enough speech)."""
+        if self._frames is None:
+            return None
+        return self._close(len(self._frames) - self._silent_frames)
+
+    def _frame(self, frame):
+        energy = float(np.sqrt(np.mean(np.square(frame, dtype=np.int64))))
+        is_speech = energy > self.energy_threshold
+        frame_start = self._pos_ms
+        self._pos_ms += self.frame_ms
+
+        if self._frames is None:
+            if not is_speech:
+                target = energy * self.dynamic_energy_ratio
+                self.energy_threshold = self.energy_threshold * self.damping + target * (1 - self.damping)
+                self._preroll.append(frame)
+                if len(self._preroll) * self.frame_ms > self.keep_silence:
+                    self._preroll.pop(0)
+                return None
+            self._frames = self._preroll + [frame]
+            self._start_ms = frame_start - len(self._preroll) * self.frame_ms
+            self._preroll = []
+            self._speech_ms = self.frame_ms
+            self._silent_frames = 0
+            return None
+
+        self._frames.append(frame)
+        if is_speech:
+            self._speech_ms += self.frame_ms
+            self._silent_frames = 0
+        else:
+            self._silent_frames += 1
+
+        if self._silent_frames * self.frame_ms >= self.min_silence_len:
+            return self._close(len(self._frames) - self._silent_frames)
+        if len(self._frames) * self.frame_ms >= self.max_segment_ms:
+            return self._close(len(self._frames), cut=True)
+        return None
+
+    def _close(self, speech_frames, cut=False):
+        """Emit the open segment; frames after speech_frames are trailing silence."""
+        frames, start_ms, speech_ms = self._frames, self._start_ms, self._speech_ms
+        padding = -(-self.keep_silence // self.frame_ms)  # frames, rounded up
+        keep = min(len(frames), speech_frames + padding)
+        # silence beyond the padding may lead into the next segment
+        preroll = self.keep_silence // self.frame_ms
+        self._preroll = frames[keep:][-preroll:] if preroll else []
+        self._frames = None
+        if cut:
+            # speech continues: open the next segment straight away
+            self._frames = []
+            self._start_ms = self._pos_ms
+            self._speech_ms = 0
+            self._silent_frames = 0
+
+        if speech_ms < self.min_speech_ms:
+            return None
+        return start_ms, start_ms + keep * self.frame_ms, np.concatenate(frames[:keep])